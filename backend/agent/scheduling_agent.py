@@ -1,53 +1,205 @@
-import json
+import asyncio
 import os
-from typing import Dict, Any, List
-from openai import OpenAI
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, partial
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import orjson
+import tiktoken
+from cachetools import TTLCache
+from openai import AsyncOpenAI
 from backend.agent.prompts import SYSTEM_PROMPT, TOOL_DESCRIPTIONS
+from backend.api.calendly_integration import calendly_api
 from backend.tools.availability_tool import check_availability
 from backend.tools.booking_tool import book_appointment
-from backend.rag.faq_rag import faq_system
+from backend.rag.faq_rag import ANSWER_CACHE_MIN_CONFIDENCE, get_faq_system
+from backend.rag.openai_utils import OPENAI_MAX_RETRIES, create_chat_completion, stream_chat_completion
 
 
+# The system prompt is sent as an identical first message on every call so the
+# provider can serve it from its prompt cache; never build it per request.
+# Each session history starts with this same object.
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Sessions are spread over a few cache keys so one hot key doesn't overflow
+PROMPT_CACHE_BUCKETS = int(os.getenv("PROMPT_CACHE_BUCKETS", "4"))
+
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again or call us at +91-731-555-0100 for immediate assistance."
+
+# Bound on in-memory sessions; idle sessions are evicted after the TTL
+MAX_SESSIONS = 10_000
+SESSION_TTL_SECONDS = 3600
+
+# Oldest messages are dropped once a session's history exceeds this many tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+
+# Idempotent tools whose results are reused within a session (TTL in seconds)
+CACHEABLE_TOOLS = {
+    "search_faq": 300,
+    "check_availability": 60
+}
+
+# A turn whose only tool call is an FAQ search at or above this confidence is
+# answered with the FAQ text directly, skipping the second completion
+FAQ_DIRECT_ANSWER_CONFIDENCE = float(os.getenv("FAQ_DIRECT_ANSWER_CONFIDENCE", "0.9"))
+
+# User messages that also ask to schedule need the model's reply, not just the
+# FAQ text, even when the model only searched the FAQ for that turn
+_SCHEDULING_INTENT_RE = re.compile(
+    r"\b(?:book(?:ing)?|appointments?|(?:re)?schedul\w*|slots?|availability)\b",
+    re.IGNORECASE
+)
+
 class SchedulingAgent:
     """Intelligent conversational agent for medical appointment scheduling"""
     
+    # Shared pool for the blocking tool functions, so they run concurrently
+    # and off the event loop
+    _tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent-tool")
+    
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not found")
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = AsyncOpenAI(api_key=self.api_key, max_retries=OPENAI_MAX_RETRIES)
         self.model = os.getenv("LLM_MODEL", "gpt-4-turbo-preview")
         
-        # Session storage for conversation context
-        self.sessions: Dict[str, List[Dict[str, Any]]] = {}
+        # Session storage for conversation context. The TTL counts from the
+        # last write, so an active session stays alive while idle ones expire.
+        self.sessions: TTLCache = TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TTL_SECONDS)
+        
+        # Per-session tool results: {session_id: {(tool, args): (expires_at, result)}}
+        self._tool_cache: TTLCache = TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TTL_SECONDS)
+        
+        # Token count of each history message after the system message,
+        # kept beside the history since the API rejects extra message keys
+        self._token_counts: TTLCache = TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TTL_SECONDS)
+        
+        # The caches aren't thread-safe and tools run on worker threads
+        self._lock = threading.RLock()
+    
+    def warm_up(self):
+        """Load the tokenizer and prime the FAQ vector store (blocking; the
+        app runs it in the background at startup)"""
+        try:
+            self._encoding
+            get_faq_system().warm_up()
+        except Exception as e:
+            print(f"⚠️ Warm-up failed: {e}")
     
     def _get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
-        """Get conversation history for a session"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
-        return self.sessions[session_id]
+        """Get conversation history for a session, starting with the system message"""
+        with self._lock:
+            history = self.sessions.get(session_id)
+            if history is None:
+                # Every session shares the same system message object
+                history = self.sessions[session_id] = [SYSTEM_MESSAGE]
+            return history
     
-    def _add_to_session(self, session_id: str, role: str, content: str):
-        """Add message to session history"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
-        
-        self.sessions[session_id].append({
-            "role": role,
-            "content": content
-        })
+    @cached_property
+    def _encoding(self) -> tiktoken.Encoding:
+        """Tokenizer for the chat model (loaded on first use)"""
+        try:
+            return tiktoken.encoding_for_model(self.model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    
+    def _count_tokens(self, content: str) -> int:
+        """Count tokens in a message's content"""
+        return len(self._encoding.encode(content or ""))
+    
+    def _get_token_counts(self, session_id: str, history: List[Dict[str, Any]]) -> List[int]:
+        """Get the per-message token counts for a session (caller holds the lock)"""
+        counts = self._token_counts.get(session_id)
+        if counts is None or len(counts) != len(history) - 1:
+            counts = [self._count_tokens(msg["content"]) for msg in history[1:]]
+        self._token_counts[session_id] = counts
+        return counts
+    
+    def _add_to_session(self, session_id: str, role: str, content: str) -> Dict[str, Any]:
+        """Add message to session history and return it"""
+        entry = {"role": role, "content": content}
+        tokens = self._count_tokens(content)
+        with self._lock:
+            history = self._get_session_history(session_id)
+            counts = self._get_token_counts(session_id, history)
+            history.append(entry)
+            counts.append(tokens)
+            
+            # Drop the oldest messages (never the system message or the newest
+            # one) until the history fits the token budget
+            total = sum(counts)
+            while total > HISTORY_TOKEN_BUDGET and len(counts) > 1:
+                total -= counts.pop(0)
+                del history[1]
+            # Re-assigning refreshes the session's TTL
+            self.sessions[session_id] = history
+        return entry
+    
+    def _remove_from_session(self, session_id: str, entry: Dict[str, Any]):
+        """Remove a message previously added to the session (e.g. after a failed turn)"""
+        with self._lock:
+            history = self.sessions.get(session_id, [])
+            for i in range(len(history) - 1, 0, -1):
+                if history[i] is entry:
+                    counts = self._get_token_counts(session_id, history)
+                    del history[i]
+                    del counts[i - 1]
+                    break
+    
+    async def _execute_tool(self, tool_name: str, arguments: Dict[str, Any], session_id: str = None) -> Dict[str, Any]:
+        """Execute a tool call, reusing cached results of idempotent tools"""
+        ttl = CACHEABLE_TOOLS.get(tool_name)
+        if ttl is None or session_id is None:
+            result = await self._run_tool(tool_name, arguments)
+        else:
+            key = self._tool_cache_key(tool_name, arguments)
+            with self._lock:
+                session_cache = self._tool_cache.setdefault(session_id, {})
+                cached = session_cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+            
+            result = await self._run_tool(tool_name, arguments)
+            if self._is_cacheable(tool_name, result):
+                with self._lock:
+                    session_cache[key] = (time.monotonic() + ttl, result)
         
-        # Keep only last 20 messages to manage context length
-        if len(self.sessions[session_id]) > 20:
-            self.sessions[session_id] = self.sessions[session_id][-20:]
+        return result
+    
+    def _tool_cache_key(self, tool_name: str, arguments: Dict[str, Any]) -> Tuple[Any, ...]:
+        """Session cache key for a tool call"""
+        key = (tool_name, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS))
+        if tool_name == "check_availability":
+            # Every booking or cancellation on the date, through the agent or
+            # the REST endpoints, bumps its revision and so misses the cache
+            key += (calendly_api.availability_revision(arguments.get("date")),)
+        return key
+    
+    def _is_cacheable(self, tool_name: str, result: Dict[str, Any]) -> bool:
+        """Whether a tool result is worth reusing within the session"""
+        if "error" in result:
+            return False
+        if tool_name == "search_faq":
+            # Same floor as FAQSystem's answer cache
+            return result.get("confidence", 0) >= ANSWER_CACHE_MIN_CONFIDENCE
+        return True
     
-    def _execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute a tool call"""
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking tool function on the tool thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._tool_executor, partial(func, *args, **kwargs))
+    
+    async def _run_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a tool without caching"""
         
         if tool_name == "search_faq":
-            question = arguments.get("question", "")
-            faq_response = faq_system.answer_question(question)
+            # FAQSystem caches answers across sessions
+            faq_response = await get_faq_system().answer_question(arguments.get("question", ""))
             return {
                 "answer": faq_response.answer,
                 "confidence": faq_response.confidence,
@@ -57,10 +209,11 @@ class SchedulingAgent:
         elif tool_name == "check_availability":
             date = arguments.get("date")
             appointment_type = arguments.get("appointment_type")
-            return check_availability(date, appointment_type)
+            return await self._run_blocking(check_availability, date, appointment_type)
         
         elif tool_name == "book_appointment":
-            return book_appointment(
+            return await self._run_blocking(
+                book_appointment,
                 date=arguments.get("date"),
                 start_time=arguments.get("start_time"),
                 appointment_type=arguments.get("appointment_type"),
@@ -73,7 +226,99 @@ class SchedulingAgent:
         else:
             return {"error": f"Unknown tool: {tool_name}"}
     
-    def chat(self, message: str, session_id: str) -> Dict[str, Any]:
+    async def _request_completion(self, history: List[Dict[str, Any]], session_id: str):
+        """Send the session history with tools and return the assistant message"""
+        # history already starts with the static system prompt and ends with
+        # the user message, so it is sent as-is
+        response = await create_chat_completion(
+            self.client,
+            model=self.model,
+            messages=history,
+            tools=TOOL_DESCRIPTIONS,
+            tool_choice="auto",
+            temperature=0.7,
+            max_tokens=1000,
+            extra_body={"prompt_cache_key": self._prompt_cache_key(session_id)}
+        )
+        return response.choices[0].message
+    
+    async def _run_tool_calls(self, assistant_message, session_id: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Execute the assistant's tool calls and return the messages to send back with the raw results"""
+        def run(tool_call):
+            tool_name = tool_call.function.name
+            tool_args = orjson.loads(tool_call.function.arguments)
+            
+            print(f"🔧 Executing tool: {tool_name} with args: {tool_args}")
+            
+            return self._execute_tool(tool_name, tool_args, session_id)
+        
+        # Execute tools concurrently; gather() keeps results in tool call order
+        tool_calls = assistant_message.tool_calls
+        results = await asyncio.gather(*(run(tool_call) for tool_call in tool_calls))
+        tool_results = [
+            {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": tool_call.function.name,
+                "content": orjson.dumps(tool_result).decode()
+            }
+            for tool_call, tool_result in zip(tool_calls, results)
+        ]
+        
+        messages = [
+            {
+                "role": "assistant",
+                "content": assistant_message.content,
+                "tool_calls": [
+                    {
+                        "id": tc.id,
+                        "type": "function",
+                        "function": {
+                            "name": tc.function.name,
+                            "arguments": tc.function.arguments
+                        }
+                    }
+                    for tc in assistant_message.tool_calls
+                ]
+            },
+            *tool_results
+        ]
+        return messages, results
+    
+    def _direct_answer(self, message: str, assistant_message, results: List[Dict[str, Any]]) -> Optional[str]:
+        """Return the FAQ answer when it can stand in for the final completion"""
+        tool_calls = assistant_message.tool_calls
+        if len(tool_calls) != 1 or tool_calls[0].function.name != "search_faq":
+            return None
+        if _SCHEDULING_INTENT_RE.search(message):
+            return None
+        
+        result = results[0]
+        if result.get("confidence", 0) < FAQ_DIRECT_ANSWER_CONFIDENCE:
+            return None
+        return result.get("answer") or None
+    
+    def _final_completion_args(self, messages: List[Dict[str, Any]], session_id: str) -> Dict[str, Any]:
+        """Arguments for the final completion after tool results (same tools so the cached prefix matches)"""
+        return dict(
+            model=self.model,
+            messages=messages,
+            tools=TOOL_DESCRIPTIONS,
+            tool_choice="none",
+            temperature=0.7,
+            max_tokens=1000,
+            extra_body={"prompt_cache_key": self._prompt_cache_key(session_id)}
+        )
+    
+    async def _final_completion(self, messages: List[Dict[str, Any]], session_id: str):
+        """Get the final response after tool results"""
+        return await create_chat_completion(self.client, **self._final_completion_args(messages, session_id))
+    
+    def _stream_final_completion(self, messages: List[Dict[str, Any]], session_id: str) -> AsyncIterator[Any]:
+        """Stream the final response after tool results"""
+        return stream_chat_completion(self.client, **self._final_completion_args(messages, session_id))
+    
+    async def chat(self, message: str, session_id: str) -> Dict[str, Any]:
         """
         Process a chat message and return response
         
@@ -84,81 +329,24 @@ class SchedulingAgent:
         Returns:
             Dictionary with response and metadata
         """
+        user_entry = self._add_to_session(session_id, "user", message)
+        history = self._get_session_history(session_id)
         try:
-            # Get conversation history
-            history = self._get_session_history(session_id)
-            # Build messages for API call
-            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-            
-            # Add conversation history
-            messages.extend(history)
-            
-            # Add current message
-            messages.append({"role": "user", "content": message})
-            # Make API call with tools
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=TOOL_DESCRIPTIONS,
-                tool_choice="auto",
-                temperature=0.7,
-                max_tokens=1000
-            )
-            print("--------->",response)
-            assistant_message = response.choices[0].message
+            assistant_message = await self._request_completion(history, session_id)
             # Handle tool calls
             if assistant_message.tool_calls:
-                # Add assistant message with tool calls to history
-                self._add_to_session(session_id, "assistant", assistant_message.content or "")
+                tool_messages, results = await self._run_tool_calls(assistant_message, session_id)
                 
-                # Execute tools and collect results
-                tool_results = []
-                for tool_call in assistant_message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
+                final_message = self._direct_answer(message, assistant_message, results)
+                if final_message is None:
+                    # Make second API call with tool results; these messages are
+                    # only needed for this call and are not kept in the session
+                    messages = [*history, *tool_messages]
                     
-                    print(f"🔧 Executing tool: {tool_name} with args: {tool_args}")
-                    
-                    tool_result = self._execute_tool(tool_name, tool_args)
-                    tool_results.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": tool_name,
-                        "content": json.dumps(tool_result)
-                    })
-                
-                # Make second API call with tool results
-                messages.append({
-                    "role": "assistant",
-                    "content": assistant_message.content,
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                        for tc in assistant_message.tool_calls
-                    ]
-                })
-                
-                for tool_result in tool_results:
-                    messages.append(tool_result)
-                
-                # Get final response
-                final_response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=1000
-                )
-                
-                final_message = final_response.choices[0].message.content
+                    final_response = await self._final_completion(messages, session_id)
+                    final_message = final_response.choices[0].message.content
                 
                 # Add to session
-                self._add_to_session(session_id, "user", message)
                 self._add_to_session(session_id, "assistant", final_message)
                 
                 return {
@@ -172,7 +360,6 @@ class SchedulingAgent:
                 response_text = assistant_message.content
                 
                 # Add to session
-                self._add_to_session(session_id, "user", message)
                 self._add_to_session(session_id, "assistant", response_text)
                 
                 return {
@@ -183,20 +370,82 @@ class SchedulingAgent:
         
         except Exception as e:
             print(f"❌ Error in chat: {e}")
+            self._remove_from_session(session_id, user_entry)
             return {
-                "response": "I apologize, but I'm having trouble processing your request right now. Please try again or call us at +91-731-555-0100 for immediate assistance.",
+                "response": FALLBACK_RESPONSE,
                 "session_id": session_id,
                 "error": str(e)
             }
     
+    async def chat_stream(self, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Process a chat message and stream the response text
+        
+        Tool selection uses a regular completion; only the final answer
+        after tool execution is streamed token by token. A confident FAQ
+        answer is yielded whole without a second completion.
+        
+        Args:
+            message: User's message
+            session_id: Session identifier for conversation context
+        
+        Yields:
+            Pieces of the response text as they are generated
+        """
+        user_entry = self._add_to_session(session_id, "user", message)
+        history = self._get_session_history(session_id)
+        try:
+            assistant_message = await self._request_completion(history, session_id)
+            
+            if not assistant_message.tool_calls:
+                response_text = assistant_message.content or ""
+                self._add_to_session(session_id, "assistant", response_text)
+                yield response_text
+                return
+            
+            tool_messages, results = await self._run_tool_calls(assistant_message, session_id)
+            
+            direct_answer = self._direct_answer(message, assistant_message, results)
+            if direct_answer is not None:
+                self._add_to_session(session_id, "assistant", direct_answer)
+                yield direct_answer
+                return
+            
+            messages = [*history, *tool_messages]
+            
+            parts = []
+            async for chunk in self._stream_final_completion(messages, session_id):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            
+            # Add to session once the full answer is known
+            self._add_to_session(session_id, "assistant", "".join(parts))
+        
+        except Exception as e:
+            print(f"❌ Error in chat stream: {e}")
+            self._remove_from_session(session_id, user_entry)
+            yield FALLBACK_RESPONSE
+    
     def reset_session(self, session_id: str):
         """Clear conversation history for a session"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        with self._lock:
+            self.sessions.pop(session_id, None)
+            self._token_counts.pop(session_id, None)
+            self._tool_cache.pop(session_id, None)
+    
+    def _prompt_cache_key(self, session_id: str) -> str:
+        """Get a stable prompt cache key for a session"""
+        bucket = zlib.crc32(session_id.encode("utf-8")) % PROMPT_CACHE_BUCKETS
+        return f"scheduling-agent-{bucket}"
     
     def get_session_info(self, session_id: str) -> Dict[str, Any]:
         """Get information about a session"""
-        history = self._get_session_history(session_id)
+        # Leave out the shared system message
+        history = self._get_session_history(session_id)[1:]
         return {
             "session_id": session_id,
             "message_count": len(history),
@@ -1,11 +1,16 @@
-import json
 import os
 from datetime import datetime, timedelta, date as dt_date
 from typing import List, Dict, Any, Optional
-import random
-import string
+import secrets
+import sqlite3
+import threading
+from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+import orjson
+
 from backend.models.schemas import (
     AppointmentType, 
     AvailabilityRequest, 
@@ -16,6 +21,31 @@ from backend.models.schemas import (
 )
 
 
+# Appointments are stored one row each; the full record is kept in `data`
+# and the slot columns are indexed for per-date lookups
+BOOKINGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    booking_id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    start_mins INTEGER NOT NULL,
+    end_mins INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    data JSON NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_date_status ON appointments (date, status);
+"""
+
+# Stored as the database's user_version once bookings.json has been imported
+BOOKINGS_SCHEMA_VERSION = 1
+
+
+@lru_cache(maxsize=4096)
+def _day_name(date_str: str) -> str:
+    """Lowercase weekday name for a YYYY-MM-DD date (strptime is slow, so memoized)"""
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    return date_obj.strftime("%A").lower()
+
+
 class CalendlyIntegration:
     """Mock Calendly API for appointment scheduling"""
     
@@ -23,58 +53,139 @@ class CalendlyIntegration:
         self.data_dir = Path("data")
         self.schedule_file = self.data_dir / "doctor_schedule.json"
         self.bookings_file = self.data_dir / "bookings.json"
+        # BOOKINGS_DB overrides the database path, e.g. to keep test bookings out of data/
+        self.db_file = Path(os.getenv("BOOKINGS_DB", self.data_dir / "bookings.db"))
+        # Serializes check-and-book so concurrent tool calls can't double book
+        self._lock = threading.RLock()
+        # date -> counter bumped whenever that date's bookings change, so
+        # callers can key cached availability on it
+        self._revisions: Dict[str, int] = defaultdict(int)
         self._load_schedule()
         self._load_bookings()
     
     def _load_schedule(self):
         """Load doctor schedule from JSON"""
-        with open(self.schedule_file, 'r') as f:
-            self.schedule = json.load(f)
+        self.schedule = orjson.loads(self.schedule_file.read_bytes())
+        
+        # Session bounds per weekday in minutes, converted once
+        self._weekday_sessions_mins: Dict[str, List[tuple]] = {
+            day: [
+                (self._time_to_minutes(session["start"]), self._time_to_minutes(session["end"]))
+                for session in hours.get("sessions", [])
+            ]
+            for day, hours in self.schedule["working_hours"].items()
+        }
+        
+        # Closed dates as sets for O(1) lookups
+        self._holidays_set = set(self.schedule.get("holidays", []))
+        self._blocked_dates_set = {block["date"] for block in self.schedule.get("blocked_dates", [])}
     
     def _load_bookings(self):
-        """Load existing bookings from JSON"""
-        if self.bookings_file.exists():
-            with open(self.bookings_file, 'r') as f:
-                self.bookings = json.load(f)
-        else:
-            self.bookings = {"appointments": []}
-            self._save_bookings()
+        """Open the bookings database and load appointments into memory"""
+        # The connection is shared by request threads; all writes go through self._lock
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.executescript(BOOKINGS_SCHEMA)
+        
+        # One-time import of bookings from the old JSON file. user_version
+        # records that it has run, so a table emptied later (e.g. by reset())
+        # never brings the JSON bookings back.
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < BOOKINGS_SCHEMA_VERSION:
+            with self._conn:
+                empty = not self._conn.execute("SELECT 1 FROM appointments LIMIT 1").fetchone()
+                if empty and self.bookings_file.exists():
+                    appointments = orjson.loads(self.bookings_file.read_bytes())["appointments"]
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO appointments VALUES (?, ?, ?, ?, ?, ?)",
+                        [self._appointment_row(appt) for appt in appointments]
+                    )
+                self._conn.execute(f"PRAGMA user_version = {BOOKINGS_SCHEMA_VERSION}")
+        
+        self._build_indexes()
+    
+    def _appointment_row(self, appt: Dict[str, Any]) -> tuple:
+        """Column values for an appointment record"""
+        return (
+            appt["booking_id"],
+            appt["date"],
+            self._time_to_minutes(appt["start_time"]),
+            self._time_to_minutes(appt["end_time"]),
+            appt["status"],
+            orjson.dumps(appt).decode()
+        )
+    
+    def _build_indexes(self):
+        """Index bookings by ID and confirmed slots by date"""
+        # date -> [(start_mins, end_mins, booking_id)] for confirmed appointments;
+        # a read cache over the database for get_availability
+        self._by_date: Dict[str, List[tuple]] = defaultdict(list)
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        for (data,) in self._conn.execute("SELECT data FROM appointments ORDER BY rowid"):
+            self._index_appointment(orjson.loads(data))
     
-    def _save_bookings(self):
-        """Save bookings to JSON file"""
-        with open(self.bookings_file, 'w') as f:
-            json.dump(self.bookings, f, indent=2)
+    def reset(self):
+        """Delete every booking (used by the test suite)"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM appointments")
+            for date_str in self._by_date:
+                self._revisions[date_str] += 1
+            self._build_indexes()
+    
+    def _index_appointment(self, appt: Dict[str, Any]):
+        """Add an appointment to the lookup indexes"""
+        self._by_id[appt["booking_id"]] = appt
+        if appt["status"] == "confirmed":
+            self._revisions[appt["date"]] += 1
+            self._by_date[appt["date"]].append((
+                self._time_to_minutes(appt["start_time"]),
+                self._time_to_minutes(appt["end_time"]),
+                appt["booking_id"]
+            ))
+    
+    def _insert_appointment(self, appt: Dict[str, Any]):
+        """Persist a new appointment, then add it to the indexes"""
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?)",
+                self._appointment_row(appt)
+            )
+        self._index_appointment(appt)
+    
+    def _mark_cancelled(self, appt: Dict[str, Any], cancelled_at: str):
+        """Persist an appointment's cancellation, then update the indexes"""
+        cancelled = {**appt, "status": "cancelled", "cancelled_at": cancelled_at}
+        with self._conn:
+            self._conn.execute(
+                "UPDATE appointments SET status = ?, data = ? WHERE booking_id = ?",
+                ("cancelled", orjson.dumps(cancelled).decode(), appt["booking_id"])
+            )
+        
+        if appt["status"] == "confirmed":
+            self._revisions[appt["date"]] += 1
+            self._by_date[appt["date"]] = [
+                slot for slot in self._by_date[appt["date"]] if slot[2] != appt["booking_id"]
+            ]
+        appt.update(status="cancelled", cancelled_at=cancelled_at)
+    
+    def availability_revision(self, date_str: str) -> int:
+        """Counter that changes whenever bookings on the date change"""
+        return self._revisions.get(date_str, 0)
     
     def _get_day_name(self, date_str: str) -> str:
         """Get day name from date string"""
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        return date_obj.strftime("%A").lower()
+        return _day_name(date_str)
     
-    def _is_working_day(self, date_str: str) -> bool:
+    def _is_working_day(self, date_str: str, day_name: Optional[str] = None) -> bool:
         """Check if the given date is a working day"""
-        day_name = self._get_day_name(date_str)
-        
-        # Check if it's a holiday
-        if date_str in self.schedule.get("holidays", []):
-            return False
-        
-        # Check if it's a blocked date
-        blocked = self.schedule.get("blocked_dates", [])
-        for block in blocked:
-            if block["date"] == date_str:
-                return False
-        
-        # Check if there are working hours
-        working_hours = self.schedule["working_hours"].get(day_name, {})
-        return len(working_hours.get("sessions", [])) > 0
-    
-    def _get_working_sessions(self, date_str: str) -> List[Dict[str, str]]:
-        """Get working sessions for a given date"""
-        if not self._is_working_day(date_str):
-            return []
+        if day_name is None:
+            day_name = self._get_day_name(date_str)
         
-        day_name = self._get_day_name(date_str)
-        return self.schedule["working_hours"][day_name]["sessions"]
+        # Not a holiday or blocked date, and there are working hours
+        return (
+            date_str not in self._holidays_set
+            and date_str not in self._blocked_dates_set
+            and bool(self._weekday_sessions_mins.get(day_name))
+        )
     
     def _time_to_minutes(self, time_str: str) -> int:
         """Convert time string (HH:MM) to minutes since midnight"""
@@ -83,37 +194,16 @@ class CalendlyIntegration:
     
     def _minutes_to_time(self, minutes: int) -> str:
         """Convert minutes since midnight to time string (HH:MM)"""
-        hours = minutes // 60
-        mins = minutes % 60
+        hours, mins = divmod(minutes, 60)
         return f"{hours:02d}:{mins:02d}"
     
     def _get_appointment_duration(self, appointment_type: str) -> int:
         """Get duration in minutes for appointment type"""
         return self.schedule["appointment_types"][appointment_type]["duration_minutes"]
     
-    def _get_booked_slots(self, date_str: str) -> List[Dict[str, str]]:
-        """Get all booked slots for a given date"""
-        booked = []
-        for appt in self.bookings["appointments"]:
-            if appt["date"] == date_str and appt["status"] == "confirmed":
-                booked.append({
-                    "start_time": appt["start_time"],
-                    "end_time": appt["end_time"],
-                    "appointment_id": appt["booking_id"]
-                })
-        return booked
-    
-    def _is_slot_available(self, date_str: str, start_time: str, end_time: str) -> bool:
-        """Check if a time slot is available"""
-        start_mins = self._time_to_minutes(start_time)
-        end_mins = self._time_to_minutes(end_time)
-        
-        booked_slots = self._get_booked_slots(date_str)
-        
-        for slot in booked_slots:
-            slot_start = self._time_to_minutes(slot["start_time"])
-            slot_end = self._time_to_minutes(slot["end_time"])
-            
+    def _is_slot_available(self, date_str: str, start_mins: int, end_mins: int) -> bool:
+        """Check if a time slot (in minutes since midnight) is available"""
+        for slot_start, slot_end, _ in self._by_date.get(date_str, []):
             # Check for overlap
             if not (end_mins <= slot_start or start_mins >= slot_end):
                 return False
@@ -121,29 +211,36 @@ class CalendlyIntegration:
         return True
     
     def get_availability(self, date_str: str, appointment_type: str) -> AvailabilityResponse:
-        """Get available time slots for a given date and appointment type"""
+        """Get available time slots for a given date and appointment type
+        
+        Slots are built from already-validated schedule data, so the models
+        are created with model_construct() to skip per-slot validation.
+        """
         
         # Validate date
         try:
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            today = dt_date.today()
-            
-            if date_obj < today:
-                return AvailabilityResponse(
-                    date=date_str,
-                    day_of_week=self._get_day_name(date_str).capitalize(),
-                    available_slots=[],
-                    total_slots=0,
-                    available_count=0
-                )
         except ValueError:
             raise ValueError(f"Invalid date format: {date_str}")
         
+        # Weekday is computed once and passed down
+        day_name = self._get_day_name(date_str)
+        day_of_week = day_name.capitalize()
+        
+        if date_obj < dt_date.today():
+            return AvailabilityResponse.model_construct(
+                date=date_str,
+                day_of_week=day_of_week,
+                available_slots=[],
+                total_slots=0,
+                available_count=0
+            )
+        
         # Check if working day
-        if not self._is_working_day(date_str):
-            return AvailabilityResponse(
+        if not self._is_working_day(date_str, day_name):
+            return AvailabilityResponse.model_construct(
                 date=date_str,
-                day_of_week=self._get_day_name(date_str).capitalize(),
+                day_of_week=day_of_week,
                 available_slots=[],
                 total_slots=0,
                 available_count=0
@@ -154,84 +251,94 @@ class CalendlyIntegration:
         buffer = self.schedule["buffer_minutes"]
         slot_duration = duration + buffer
         
-        # Generate slots
-        sessions = self._get_working_sessions(date_str)
+        # Session bounds are precomputed in minutes; work on integers only
+        sessions_mins = self._weekday_sessions_mins[day_name]
+        # Booked ranges for the day as a (B, 2) array of minutes
+        booked = np.array(
+            [(slot_start, slot_end) for slot_start, slot_end, _ in self._by_date.get(date_str, [])],
+            dtype=np.int32
+        ).reshape(-1, 2)
         all_slots = []
         
-        for session in sessions:
-            session_start = self._time_to_minutes(session["start"])
-            session_end = self._time_to_minutes(session["end"])
+        for session_start, session_end in sessions_mins:
+            starts = np.arange(session_start, session_end - duration + 1, slot_duration, dtype=np.int32)
+            ends = starts + duration
+            
+            # A candidate is taken if it overlaps any booked range
+            overlap = (
+                (ends[:, None] > booked[:, 0]) & (starts[:, None] < booked[:, 1])
+            ).any(axis=1)
             
-            current = session_start
-            while current + duration <= session_end:
-                start_time = self._minutes_to_time(current)
-                end_time = self._minutes_to_time(current + duration)
-                
-                is_available = self._is_slot_available(date_str, start_time, end_time)
-                
-                slot = TimeSlot(
-                    start_time=start_time,
-                    end_time=end_time,
-                    available=is_available,
+            for start_mins, end_mins, taken in zip(starts.tolist(), ends.tolist(), overlap.tolist()):
+                slot = TimeSlot.model_construct(
+                    start_time=self._minutes_to_time(start_mins),
+                    end_time=self._minutes_to_time(end_mins),
+                    available=not taken,
                     appointment_id=None
                 )
                 all_slots.append(slot)
-                
-                current += slot_duration
         
         available_count = sum(1 for slot in all_slots if slot.available)
         
-        return AvailabilityResponse(
+        return AvailabilityResponse.model_construct(
             date=date_str,
-            day_of_week=self._get_day_name(date_str).capitalize(),
+            day_of_week=day_of_week,
             available_slots=all_slots,
             total_slots=len(all_slots),
             available_count=available_count
         )
     
-    def _generate_booking_id(self) -> str:
-        """Generate unique booking ID"""
-        date_part = datetime.now().strftime("%Y%m%d")
-        random_part = ''.join(random.choices(string.digits, k=4))
-        return f"APPT-{date_part}-{random_part}"
+    def _generate_booking_id(self, now: datetime) -> str:
+        """Generate unique booking ID (caller holds the lock)"""
+        # Only 10,000 IDs per day, so draws that collide with an existing
+        # booking (the primary key) are redrawn
+        while True:
+            booking_id = f"APPT-{now:%Y%m%d}-{secrets.randbelow(10000):04d}"
+            if booking_id not in self._by_id:
+                return booking_id
     
     def _generate_confirmation_code(self) -> str:
-        """Generate confirmation code"""
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        """Generate confirmation code (6 uppercase hex characters)"""
+        return secrets.token_hex(3).upper()
     
     def book_appointment(self, booking_request: BookingRequest) -> BookingResponse:
         """Book an appointment"""
+        with self._lock:
+            return self._book_appointment(booking_request)
+    
+    def _book_appointment(self, booking_request: BookingRequest) -> BookingResponse:
+        """Book an appointment (caller holds the lock)"""
         
         date_str = booking_request.date
         start_time = booking_request.start_time
         appointment_type = booking_request.appointment_type.value
         
+        # One clock read for the past-date check, booking ID and created_at
+        now = datetime.now()
+        
         # Validate date is not in the past
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-        if date_obj < dt_date.today():
+        if date_obj < now.date():
             raise ValueError("Cannot book appointments in the past")
         
         # Check if it's a working day
-        if not self._is_working_day(date_str):
+        day_name = self._get_day_name(date_str)
+        if not self._is_working_day(date_str, day_name):
             raise ValueError(f"Clinic is closed on {date_str}")
         
         # Calculate end time
         duration = self._get_appointment_duration(appointment_type)
         start_mins = self._time_to_minutes(start_time)
-        end_time = self._minutes_to_time(start_mins + duration)
+        end_mins = start_mins + duration
+        end_time = self._minutes_to_time(end_mins)
         
         # Check if slot is available
-        if not self._is_slot_available(date_str, start_time, end_time):
+        if not self._is_slot_available(date_str, start_mins, end_mins):
             raise ValueError(f"Time slot {start_time} is not available")
         
         # Check if within working hours
-        sessions = self._get_working_sessions(date_str)
         in_session = False
-        for session in sessions:
-            session_start = self._time_to_minutes(session["start"])
-            session_end = self._time_to_minutes(session["end"])
-            end_mins = self._time_to_minutes(end_time)
-            
+        for session_start, session_end in self._weekday_sessions_mins[day_name]:
             if session_start <= start_mins and end_mins <= session_end:
                 in_session = True
                 break
@@ -240,7 +347,7 @@ class CalendlyIntegration:
             raise ValueError(f"Time slot {start_time} is outside working hours")
         
         # Generate booking details
-        booking_id = self._generate_booking_id()
+        booking_id = self._generate_booking_id(now)
         confirmation_code = self._generate_confirmation_code()
         
         # Create appointment record
@@ -258,14 +365,13 @@ class CalendlyIntegration:
                 "phone": booking_request.patient.phone
             },
             "reason": booking_request.reason,
-            "created_at": datetime.now().isoformat(),
+            "created_at": now.isoformat(),
             "clinic": "HealthCare Plus Clinic",
             "doctor": "Dr. Rajendra Kumar Gupta"
         }
         
         # Save booking
-        self.bookings["appointments"].append(appointment)
-        self._save_bookings()
+        self._insert_appointment(appointment)
         
         # Prepare response
         type_info = self.schedule["appointment_types"][appointment_type]
@@ -276,7 +382,7 @@ class CalendlyIntegration:
             confirmation_code=confirmation_code,
             details={
                 "date": date_str,
-                "day": self._get_day_name(date_str).capitalize(),
+                "day": day_name.capitalize(),
                 "time": start_time,
                 "duration": f"{type_info['duration_minutes']} minutes",
                 "appointment_type": type_info["name"],
@@ -294,20 +400,16 @@ class CalendlyIntegration:
     
     def get_booking_by_id(self, booking_id: str) -> Optional[Dict[str, Any]]:
         """Get booking details by ID"""
-        for appt in self.bookings["appointments"]:
-            if appt["booking_id"] == booking_id:
-                return appt
-        return None
+        return self._by_id.get(booking_id)
     
     def cancel_booking(self, booking_id: str) -> bool:
         """Cancel a booking"""
-        for appt in self.bookings["appointments"]:
-            if appt["booking_id"] == booking_id:
-                appt["status"] = "cancelled"
-                appt["cancelled_at"] = datetime.now().isoformat()
-                self._save_bookings()
-                return True
-        return False
+        with self._lock:
+            if booking_id not in self._by_id:
+                return False
+            
+            self._mark_cancelled(self._by_id[booking_id], datetime.now().isoformat())
+            return True
 
 
 # Singleton instance
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from datetime import datetime
+import orjson
 from backend.models.schemas import (
     ChatRequest, 
     ChatResponse, 
@@ -7,7 +9,7 @@ from backend.models.schemas import (
     FAQResponse
 )
 from backend.agent.scheduling_agent import agent
-from backend.rag.faq_rag import faq_system
+from backend.rag.faq_rag import get_faq_system
 
 
 router = APIRouter()
@@ -24,7 +26,7 @@ async def chat_endpoint(request: ChatRequest):
     - Seamless context switching between both
     """
     try:
-        result = agent.chat(request.message, request.session_id)
+        result = await agent.chat(request.message, request.session_id)
         
         return ChatResponse(
             response=result["response"],
@@ -42,6 +44,20 @@ async def chat_endpoint(request: ChatRequest):
         )
 
 
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streaming variant of /chat
+    
+    Returns the assistant's reply as plain text chunks while it is
+    being generated, so the client can render it progressively.
+    """
+    return StreamingResponse(
+        agent.chat_stream(request.message, request.session_id),
+        media_type="text/plain"
+    )
+
+
 @router.post("/ask-faq", response_model=FAQResponse)
 async def ask_faq_endpoint(request: FAQRequest):
     """
@@ -55,7 +71,7 @@ async def ask_faq_endpoint(request: FAQRequest):
     - COVID-19 protocols
     """
     try:
-        response = faq_system.answer_question(request.question, include_sources=True)
+        response = await get_faq_system().answer_question(request.question, include_sources=True)
         return response
     
     except Exception as e:
@@ -65,6 +81,29 @@ async def ask_faq_endpoint(request: FAQRequest):
         )
 
 
+@router.post("/ask-faq/stream")
+async def ask_faq_stream_endpoint(request: FAQRequest):
+    """
+    Streaming variant of /ask-faq (Server-Sent Events)
+    
+    Sends `token` events with answer text as it is generated, then a
+    single `done` event with the full FAQResponse (sources, confidence,
+    retrieved chunks). Failures are reported as an `error` event.
+    """
+    async def events():
+        try:
+            async for item in get_faq_system().stream_answer(request.question):
+                if isinstance(item, FAQResponse):
+                    yield f"event: done\ndata: {item.model_dump_json()}\n\n"
+                else:
+                    yield f"event: token\ndata: {orjson.dumps(item).decode()}\n\n"
+        except Exception as e:
+            detail = orjson.dumps({"detail": f"Error processing FAQ: {str(e)}"}).decode()
+            yield f"event: error\ndata: {detail}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.post("/reset-session/{session_id}")
 async def reset_session_endpoint(session_id: str):
     """Reset conversation history for a session"""
@@ -1,11 +1,19 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from datetime import datetime
+import asyncio
 import os
+import httpx
 from dotenv import load_dotenv
+from openai import AsyncOpenAI
 
 from backend.api.chat import router as chat_router
 from backend.api.calendly_integration import calendly_api
+from backend.agent.scheduling_agent import agent
+from backend.rag.embeddings import get_embedding_service
+from backend.rag.faq_rag import get_faq_system
+from backend.rag.openai_utils import OPENAI_MAX_RETRIES
 from backend.models.schemas import (
     HealthCheckResponse,
     AvailabilityRequest,
@@ -15,13 +23,18 @@ from backend.models.schemas import (
 # Load environment variables
 load_dotenv()
 
+# Connection pool shared by all OpenAI calls (agent, FAQ answers, embeddings)
+OPENAI_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+OPENAI_HTTP_TIMEOUT = httpx.Timeout(60, connect=5)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Medical Appointment Scheduling Agent",
     description="Intelligent conversational agent for scheduling medical appointments with RAG-based FAQ system",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -37,6 +50,53 @@ app.add_middleware(
 app.include_router(chat_router, prefix="/api", tags=["Chat & FAQ"])
 
 
+@app.on_event("startup")
+async def open_openai_client():
+    """Route OpenAI calls through one keep-alive pool and open a connection early"""
+    http_client = httpx.AsyncClient(
+        limits=OPENAI_HTTP_LIMITS,
+        timeout=OPENAI_HTTP_TIMEOUT,
+        http2=True
+    )
+    client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=http_client,
+        max_retries=OPENAI_MAX_RETRIES
+    )
+    
+    # Any response will do; this pays DNS and the TLS handshake before the first request
+    try:
+        await http_client.get(str(client.base_url))
+    except httpx.HTTPError as e:
+        print(f"⚠️ OpenAI connection warm-up failed: {e}")
+    
+    app.state.openai_http_client = http_client
+    agent.client = client
+    get_faq_system().client = client
+    get_embedding_service().async_client = client
+    
+    # Common questions are answered without the LLM once these are embedded
+    try:
+        await get_faq_system().canned_answers.load()
+    except Exception as e:
+        print(f"⚠️ Loading canned FAQ answers failed: {e}")
+
+
+@app.on_event("startup")
+async def warm_up_agent():
+    """Load the tokenizer and FAQ index in the background, so the first chat
+    doesn't pay the cold start and importing the agent stays side-effect free"""
+    app.state.agent_warm_up = asyncio.get_running_loop().run_in_executor(None, agent.warm_up)
+
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    """Close the shared OpenAI connection pool"""
+    http_client = getattr(app.state, "openai_http_client", None)
+    if http_client is not None:
+        await http_client.aclose()
+
+
 @app.get("/", tags=["Root"])
 async def root():
     """Root endpoint"""
@@ -158,4 +218,16 @@ async def internal_error_handler(request, exc):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("BACKEND_PORT", 8000))
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
+    dev = os.getenv("ENV") == "dev"
+    
+    # Chat sessions and the booking slot index live in process memory, so
+    # extra workers (WEB_CONCURRENCY) need sticky sessions and a single booker
+    uvicorn.run(
+        "backend.main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=1 if dev else int(os.getenv("WEB_CONCURRENCY", "1")),
+        reload=dev
+    )
\ No newline at end of file
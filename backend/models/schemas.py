@@ -1,9 +1,23 @@
-from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional, List, Dict, Any
+import re
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, StringConstraints, field_validator
+from typing import Annotated, Optional, List, Dict, Any
 from datetime import datetime, date, time
 from enum import Enum
 
 
+# Reusable constrained string types; patterns are compiled once with the schema
+DateStr = Annotated[str, StringConstraints(pattern=r'^\d{4}-\d{2}-\d{2}$')]
+TimeStr = Annotated[str, StringConstraints(pattern=r'^\d{2}:\d{2}$')]
+PhoneStr = Annotated[str, StringConstraints(pattern=r'^\+?[\d\s\-()]+$')]
+
+# Everything except digits and '+', stripped before counting phone digits
+_PHONE_DIGITS_RE = re.compile(r'[^\d+]')
+
+# Config for response models: they are built once and never mutated, and
+# cached FAQ answers are shared between requests
+FROZEN = ConfigDict(frozen=True)
+
+
 class AppointmentType(str, Enum):
     CONSULTATION = "consultation"
     FOLLOWUP = "followup"
@@ -14,30 +28,34 @@ class AppointmentType(str, Enum):
 class PatientInfo(BaseModel):
     name: str = Field(..., min_length=2, max_length=100)
     email: EmailStr
-    phone: str = Field(..., pattern=r'^\+?[\d\s\-()]+$')
+    phone: PhoneStr
     
-    @validator('phone')
+    @field_validator('phone')
+    @classmethod
     def validate_phone(cls, v):
         # Remove spaces, dashes, parentheses
-        cleaned = ''.join(c for c in v if c.isdigit() or c == '+')
-        if len(cleaned) < 10:
+        if len(_PHONE_DIGITS_RE.sub('', v)) < 10:
             raise ValueError('Phone number must have at least 10 digits')
         return v
 
 
 class TimeSlot(BaseModel):
-    start_time: str = Field(..., pattern=r'^\d{2}:\d{2}$')
-    end_time: str = Field(..., pattern=r'^\d{2}:\d{2}$')
+    model_config = FROZEN
+    
+    start_time: TimeStr
+    end_time: TimeStr
     available: bool
     appointment_id: Optional[str] = None
 
 
 class AvailabilityRequest(BaseModel):
-    date: str = Field(..., pattern=r'^\d{4}-\d{2}-\d{2}$')
+    date: DateStr
     appointment_type: AppointmentType
 
 
 class AvailabilityResponse(BaseModel):
+    model_config = FROZEN
+    
     date: str
     day_of_week: str
     available_slots: List[TimeSlot]
@@ -47,13 +65,15 @@ class AvailabilityResponse(BaseModel):
 
 class BookingRequest(BaseModel):
     appointment_type: AppointmentType
-    date: str = Field(..., pattern=r'^\d{4}-\d{2}-\d{2}$')
-    start_time: str = Field(..., pattern=r'^\d{2}:\d{2}$')
+    date: DateStr
+    start_time: TimeStr
     patient: PatientInfo
     reason: str = Field(..., min_length=5, max_length=500)
 
 
 class BookingResponse(BaseModel):
+    model_config = FROZEN
+    
     booking_id: str
     status: str
     confirmation_code: str
@@ -67,6 +87,8 @@ class ChatRequest(BaseModel):
 
 
 class ChatResponse(BaseModel):
+    model_config = FROZEN
+    
     response: str
     session_id: str
     timestamp: datetime
@@ -78,6 +100,8 @@ class FAQRequest(BaseModel):
 
 
 class FAQResponse(BaseModel):
+    model_config = FROZEN
+    
     answer: str
     sources: List[str]
     confidence: float
@@ -85,12 +109,16 @@ class FAQResponse(BaseModel):
 
 
 class HealthCheckResponse(BaseModel):
+    model_config = FROZEN
+    
     status: str
     timestamp: datetime
     services: Dict[str, str]
 
 
 class ErrorResponse(BaseModel):
+    model_config = FROZEN
+    
     error: str
     detail: Optional[str] = None
     timestamp: datetime
\ No newline at end of file
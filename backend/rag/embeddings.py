@@ -1,6 +1,18 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+import asyncio
 import os
-from typing import List
+import threading
+from typing import List, Optional, Set, Tuple
+from backend.rag.openai_utils import (
+    EMBEDDING_TIMEOUT_SECONDS,
+    OPENAI_MAX_RETRIES,
+    create_embeddings,
+    retry_on_transient_error
+)
+
+# Concurrent aget_embedding calls arriving within this window are sent as one request
+EMBEDDING_BATCH_SIZE = 16
+EMBEDDING_BATCH_WINDOW_SECONDS = 0.008
 
 
 class EmbeddingService:
@@ -11,11 +23,25 @@ class EmbeddingService:
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
         
-        self.client = OpenAI(api_key=self.api_key)
+        # The sync client serves Chroma's embedding function; query-time
+        # batches go through the async one
+        self.client = OpenAI(api_key=self.api_key, max_retries=OPENAI_MAX_RETRIES)
+        self.async_client = self.create_async_client()
         self.model = "text-embedding-3-small"
+        
+        # Micro-batching state, bound to the event loop that first used it
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        # In-flight batch requests; the loop only keeps weak references to tasks
+        self._pending: Set[asyncio.Task] = set()
     
+    def create_async_client(self) -> AsyncOpenAI:
+        """New async client for this service's account (connections stay bound to the loop that uses them)"""
+        return AsyncOpenAI(api_key=self.api_key, max_retries=OPENAI_MAX_RETRIES)
+    
+    @retry_on_transient_error
     def get_embedding(self, text: str) -> List[float]:
-        """Get embedding for a single text"""
+        """Get embedding for a single text (blocking; use aget_embedding in async code)"""
         try:
             response = self.client.embeddings.create(
                 input=text,
@@ -26,8 +52,9 @@ class EmbeddingService:
             print(f"Error generating embedding: {e}")
             raise
     
+    @retry_on_transient_error
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings for multiple texts"""
+        """Get embeddings for multiple texts (blocking; use aget_embeddings in async code)"""
         try:
             response = self.client.embeddings.create(
                 input=texts,
@@ -37,7 +64,98 @@ class EmbeddingService:
         except Exception as e:
             print(f"Error generating embeddings: {e}")
             raise
+    
+    async def aget_embeddings(self, texts: List[str], client: Optional[AsyncOpenAI] = None) -> List[List[float]]:
+        """Get embeddings for multiple texts with the async client (or the given one)"""
+        try:
+            response = await create_embeddings(
+                client or self.async_client,
+                timeout=EMBEDDING_TIMEOUT_SECONDS,
+                input=texts,
+                model=self.model
+            )
+            return [data.embedding for data in response.data]
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+    
+    async def aget_embedding(self, text: str) -> List[float]:
+        """Get embedding for a single text, batched with concurrent callers"""
+        queue = self._ensure_batcher()
+        future = asyncio.get_running_loop().create_future()
+        # The API rejects empty inputs, which would fail the whole batch
+        await queue.put((text or " ", future))
+        return await future
+    
+    def _ensure_batcher(self) -> asyncio.Queue:
+        """Start the batching task on the running loop if it isn't running there yet"""
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.done() or self._batcher.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._batcher = loop.create_task(self._run_batcher(self._queue))
+        return self._queue
+    
+    async def _run_batcher(self, queue: asyncio.Queue):
+        """Collect queued texts into batches and embed each batch with one request"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + EMBEDDING_BATCH_WINDOW_SECONDS
+            while len(batch) < EMBEDDING_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Don't wait for the request, so the next batch can fill meanwhile
+            task = loop.create_task(self._embed_batch(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+    
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Embed a batch of texts and resolve each caller's future"""
+        try:
+            embeddings = await self.aget_embeddings([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+class ChromaEmbeddingFunction:
+    """Adapter so a Chroma collection embeds documents and queries with the embedding service"""
+    
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        # Resolved per call so creating a collection doesn't create the service
+        return get_embedding_service().get_embeddings(list(input))
+
+
+# Shared instance, created on first use so importing this module doesn't
+# construct OpenAI clients (or fail on a missing API key)
+_embedding_service: Optional[EmbeddingService] = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Get the shared EmbeddingService"""
+    global _embedding_service
+    if _embedding_service is None:
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
+    return _embedding_service
 
 
-# Singleton instance
-embedding_service = EmbeddingService()
\ No newline at end of file
+def __getattr__(name: str):
+    # Keeps `from backend.rag.embeddings import embedding_service` working
+    if name == "embedding_service":
+        return get_embedding_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,26 +1,40 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
-from typing import List, Dict, Any, Optional
-from backend.rag.vector_store import vector_store
+import re
+import threading
+from pathlib import Path
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple, Union
+from functools import cached_property
+import numpy as np
+import orjson
+import tiktoken
+from cachetools import LRUCache
+from backend.rag.embeddings import get_embedding_service
+from backend.rag.openai_utils import (
+    CHAT_TIMEOUT_SECONDS,
+    OPENAI_MAX_RETRIES,
+    create_chat_completion,
+    stream_chat_completion
+)
+from backend.rag.vector_store import get_vector_store
 from backend.models.schemas import FAQRequest, FAQResponse
 from dotenv import load_dotenv
 load_dotenv()
 
-class FAQSystem:
-    """RAG-based FAQ system for clinic information"""
-    
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("OpenAI API key not found")
-        
-        self.client = OpenAI(api_key=self.api_key)
-        self.model = os.getenv("LLM_MODEL", "gpt-4-turbo-preview")
-        self.vector_store = vector_store
-    
-    def _create_system_prompt(self) -> str:
-        """Create system prompt for FAQ answering"""
-        return """You are a helpful medical clinic assistant for HealthCare Plus Clinic. 
+# Answered questions kept for reuse; the oldest is evicted first
+ANSWER_CACHE_SIZE = 1000
+
+# Cosine similarity above which a new question reuses a previous answer
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Answers below this confidence (no context, short or hedged) are not cached,
+# so the question is retried rather than answered the same way again
+ANSWER_CACHE_MIN_CONFIDENCE = 0.7
+
+# Static system prompt, sent as the first message of every FAQ request so the
+# provider's prompt cache can match the shared prefix. Retrieved context is
+# dynamic and must always go in a later message, never in this prompt.
+FAQ_SYSTEM_PROMPT = """You are a helpful medical clinic assistant for HealthCare Plus Clinic. 
 
 Your role is to answer patient questions about the clinic using ONLY the information provided in the context. 
 
@@ -39,25 +53,294 @@ Clinic Details:
 - Location: 302 Old Palasia, Indore, MP 452001
 - Phone: +91-731-555-0100
 - Email: info@healthcareplus.com"""
+
+# Common questions answered from clinic_info.json without retrieval or the LLM
+# when the question embedding is at least this similar to a known phrasing
+CLINIC_INFO_FILE = "data/clinic_info.json"
+CANNED_ANSWER_THRESHOLD = 0.92
+
+# Retrieval fetches this many candidates and keeps a diverse subset of them
+# by Maximal Marginal Relevance (1.0 = pure relevance, 0.0 = pure diversity)
+RETRIEVAL_CANDIDATES = 10
+MMR_LAMBDA = 0.5
+
+# Retrieved chunks are added to the prompt until they reach this many tokens
+# (the top chunk is always kept)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+
+# Retrieved contexts kept for reuse, keyed by punctuation-free question
+RETRIEVAL_CACHE_SIZE = 512
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+# Answer hedges that lower the confidence score
+_LOW_CONF_RE = re.compile(r"i don't have|not sure|don't know", re.IGNORECASE)
+
+# Answer lengths (characters) for the confidence heuristic
+SHORT_ANSWER_CHARS = 20
+COMPLETE_ANSWER_CHARS = 50
+
+
+def _normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups (case and whitespace insensitive)"""
+    return _WHITESPACE_RE.sub(" ", question.strip().lower())
+
+
+def _retrieval_key(question: str) -> str:
+    """Normalize a question for retrieval cache lookups (also ignores punctuation)"""
+    return _normalize_question(_PUNCTUATION_RE.sub("", question))
+
+
+def _mmr_select(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = MMR_LAMBDA
+) -> List[int]:
+    """Pick k candidate indices balancing relevance to the query against redundancy"""
+    candidates = candidate_embeddings / np.linalg.norm(candidate_embeddings, axis=1, keepdims=True)
+    relevance = candidates @ (query_embedding / np.linalg.norm(query_embedding))
+    similarity = candidates @ candidates.T
+    
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = similarity[:, selected].max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+def _canned_intents(clinic_data: Dict[str, Any]) -> List[Tuple[List[str], str, str]]:
+    """Build (example questions, answer, source id) for the most asked questions"""
+    intents = []
+    
+    hours = clinic_data.get("hours_of_operation")
+    if hours:
+        intents.append((
+            ["What are your clinic hours?", "When is the clinic open?", "What time do you open and close?", "Are you open on weekends?"],
+            f"Our clinic hours are Monday to Friday: {hours['monday_to_friday']}, and Saturday: {hours['saturday']}. "
+            f"Sunday: {hours['sunday']}. {hours['holidays']}. {hours['emergency_note']}.",
+            "hours_of_operation"
+        ))
+    
+    billing = clinic_data.get("insurance_and_billing")
+    if billing:
+        intents.append((
+            ["What insurance do you accept?", "Do you take my insurance?", "Which insurance providers are accepted?"],
+            "We accept " + ", ".join(billing["accepted_insurance"]) + ". "
+            "Payment methods: " + ", ".join(billing["payment_methods"]) + ".",
+            "insurance_billing"
+        ))
+    
+    location = clinic_data.get("location_and_directions")
+    if location:
+        intents.append((
+            ["Where is the clinic located?", "What is the clinic address?", "How do I get to the clinic?"],
+            f"We're at {location['address']} ({location['landmark']}). {location['directions']}",
+            "location_directions"
+        ))
+        intents.append((
+            ["Is parking available?", "Where can I park?", "Do you have parking?"],
+            location["parking"],
+            "location_directions"
+        ))
+    
+    contact = clinic_data.get("contact_information")
+    if contact:
+        intents.append((
+            ["What is your phone number?", "How can I contact the clinic?", "What is the clinic's email?"],
+            f"You can call us at {contact['appointments']} or email {contact['general_inquiries']}. "
+            f"WhatsApp: {contact['whatsapp']}. {contact['emergency']}.",
+            "contact_information"
+        ))
+    
+    for idx, faq in enumerate(clinic_data.get("frequently_asked_questions", [])):
+        intents.append(([faq["question"]], faq["answer"], f"faq_{idx}"))
+    
+    return intents
+
+
+class CannedAnswers:
+    """Known answers to common questions, matched by question embedding similarity"""
+    
+    def __init__(self, threshold: float = CANNED_ANSWER_THRESHOLD):
+        self.threshold = threshold
+        # Unit-length embeddings of the example questions; row i answers with _responses[i]
+        self._vectors: Optional[np.ndarray] = None
+        self._responses: List[FAQResponse] = []
+    
+    async def load(self, clinic_info_path: str = CLINIC_INFO_FILE):
+        """Embed the example questions for the common intents"""
+        intents = _canned_intents(orjson.loads(Path(clinic_info_path).read_bytes()))
+        
+        questions = []
+        responses = []
+        for examples, answer, source in intents:
+            response = FAQResponse(answer=answer, sources=[source], confidence=0.95, retrieved_chunks=[])
+            questions.extend(examples)
+            responses.extend([response] * len(examples))
+        
+        vectors = np.asarray(await get_embedding_service().aget_embeddings(questions), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._vectors, self._responses = vectors, responses
+    
+    def match(self, embedding: np.ndarray) -> Optional[FAQResponse]:
+        """Return the canned answer for a unit-length question embedding, if one is close enough"""
+        if self._vectors is None:
+            return None
+        scores = self._vectors @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] <= self.threshold:
+            return None
+        return self._responses[best]
+
+
+class AnswerCache:
+    """Two-tier FAQ answer cache: exact normalized question, then embedding similarity"""
+    
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._exact: Dict[str, FAQResponse] = {}
+        
+        # Ring buffer of unit-length question embeddings; row i answers with
+        # _responses[i] and was stored under _keys[i]
+        self._vectors: Optional[np.ndarray] = None
+        self._responses: List[Optional[FAQResponse]] = [None] * maxsize
+        self._keys: List[Optional[str]] = [None] * maxsize
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[FAQResponse]:
+        """Look up an answer by normalized question"""
+        return self._exact.get(key)
+    
+    def get_similar(self, embedding: np.ndarray) -> Optional[FAQResponse]:
+        """Look up the answer of the most similar previous question"""
+        with self._lock:
+            if not self._size:
+                return None
+            scores = self._vectors[:self._size] @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            return self._responses[best]
+    
+    def add(self, key: str, embedding: np.ndarray, response: FAQResponse):
+        """Store an answer, evicting the oldest entry when full"""
+        with self._lock:
+            if key in self._exact:
+                return
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, embedding.shape[0]), dtype=np.float32)
+            
+            slot = self._next
+            evicted = self._keys[slot]
+            if evicted is not None:
+                del self._exact[evicted]
+            
+            self._vectors[slot] = embedding
+            self._responses[slot] = response
+            self._keys[slot] = key
+            self._exact[key] = response
+            
+            self._next = (slot + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+
+
+class FAQSystem:
+    """RAG-based FAQ system for clinic information"""
+    
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OpenAI API key not found")
+        
+        self.client = AsyncOpenAI(api_key=self.api_key, max_retries=OPENAI_MAX_RETRIES)
+        self.model = os.getenv("LLM_MODEL", "gpt-4-turbo-preview")
+        self.vector_store = get_vector_store()
+        self.answer_cache = AnswerCache()
+        self.canned_answers = CannedAnswers()
+        self._retrieval_cache: LRUCache = LRUCache(maxsize=RETRIEVAL_CACHE_SIZE)
+        # Token count per chunk text; the documents rarely change
+        self._chunk_tokens: LRUCache = LRUCache(maxsize=RETRIEVAL_CACHE_SIZE)
+        
+        self._system_prompt = FAQ_SYSTEM_PROMPT
+        self._system_message = {"role": "system", "content": self._system_prompt}
+    
+    @cached_property
+    def _encoding(self) -> tiktoken.Encoding:
+        """Tokenizer for the chat model (loaded on first use)"""
+        try:
+            return tiktoken.encoding_for_model(self.model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    
+    def _count_chunk_tokens(self, text: str) -> int:
+        """Count tokens in a retrieved chunk, memoized by text"""
+        tokens = self._chunk_tokens.get(text)
+        if tokens is None:
+            tokens = self._chunk_tokens[text] = len(self._encoding.encode(text))
+        return tokens
+    
+    def _create_system_prompt(self) -> str:
+        """Return the system prompt for FAQ answering (static, see FAQ_SYSTEM_PROMPT)"""
+        return self._system_prompt
+    
+    def warm_up(self):
+        """Run a throwaway retrieval so the embedding model and index are loaded"""
+        self.vector_store.search("clinic hours", n_results=1)
     
-    def _retrieve_context(self, question: str, n_results: int = 3) -> tuple[str, List[str], List[str]]:
+    async def _retrieve_context(
+        self,
+        question: str,
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None
+    ) -> tuple[str, List[str], List[str]]:
         """Retrieve relevant context from vector store"""
-        results = self.vector_store.search(question, n_results=n_results)
+        # The store version is part of the key, so re-ingesting invalidates old entries
+        key = (self.vector_store.version, _retrieval_key(question), n_results)
+        cached = self._retrieval_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        if query_embedding is None:
+            query_embedding = await get_embedding_service().aget_embedding(question)
+        
+        results = await self.vector_store.asearch(
+            question,
+            n_results=max(n_results, RETRIEVAL_CANDIDATES),
+            query_embedding=query_embedding,
+            include_embeddings=True
+        )
         
         if not results:
             return "", [], []
         
-        # Combine retrieved texts
-        context_parts = []
-        sources = []
-        chunks = []
+        # Drop near-duplicate chunks, keeping retrieval order among the picks
+        selected = _mmr_select(
+            np.asarray(query_embedding, dtype=np.float32),
+            np.asarray([result["embedding"] for result in results], dtype=np.float32),
+            n_results
+        )
+        results = [results[i] for i in sorted(selected)]
         
-        for result in results:
-            context_parts.append(result["text"])
-            sources.append(result["id"])
-            chunks.append(result["text"])
+        # Keep the prompt within the context token budget
+        total = self._count_chunk_tokens(results[0]["text"])
+        for end in range(1, len(results)):
+            total += self._count_chunk_tokens(results[end]["text"])
+            if total > CONTEXT_TOKEN_BUDGET:
+                results = results[:end]
+                break
         
-        context = "\n\n".join(context_parts)
+        # Combine retrieved texts; the chunk list doubles as the join input
+        chunks = [result["text"] for result in results]
+        sources = [result["id"] for result in results]
+        context = "\n\n".join(chunks)
+        self._retrieval_cache[key] = (context, sources, chunks)
         return context, sources, chunks
     
     def _calculate_confidence(self, answer: str, context: str) -> float:
@@ -66,31 +349,66 @@ Clinic Details:
         if not context:
             return 0.3
         
-        if len(answer) < 20:
+        answer_length = len(answer)
+        if answer_length < SHORT_ANSWER_CHARS:
             return 0.5
         
-        if "I don't have" in answer or "not sure" in answer or "don't know" in answer:
+        if _LOW_CONF_RE.search(answer):
             return 0.4
         
         # If answer seems complete
-        if len(answer) > 50:
+        if answer_length > COMPLETE_ANSWER_CHARS:
             return 0.9
         
         return 0.7
     
-    def answer_question(self, question: str, include_sources: bool = False) -> FAQResponse:
-        """Answer a question using RAG"""
+    def _with_sources(self, response: FAQResponse, include_sources: bool) -> FAQResponse:
+        """Return an answer without the retrieved chunks unless requested"""
+        if include_sources:
+            return response
+        return response.model_copy(update={"retrieved_chunks": None})
+    
+    async def answer_question(self, question: str, include_sources: bool = False) -> FAQResponse:
+        """Answer a question using RAG, reusing answers to the same or near-identical questions"""
+        async for item in self.stream_answer(question):
+            response = item
+        return self._with_sources(response, include_sources)
+    
+    async def stream_answer(self, question: str) -> AsyncIterator[Union[str, FAQResponse]]:
+        """
+        Answer a question using RAG, streaming the answer text
+        
+        Yields:
+            Pieces of the answer text as they are generated, then the
+            complete FAQResponse (confidence is scored on the full answer)
+        """
+        
+        key = _normalize_question(question)
+        cached = self.answer_cache.get(key)
+        if cached is not None:
+            yield cached.answer
+            yield cached
+            return
+        
+        # Embed once for both the answer cache and the retrieval
+        query_embedding = await get_embedding_service().aget_embedding(question)
+        unit_embedding = np.asarray(query_embedding, dtype=np.float32)
+        unit_embedding /= np.linalg.norm(unit_embedding) or 1.0
+        
+        cached = self.answer_cache.get_similar(unit_embedding) or self.canned_answers.match(unit_embedding)
+        if cached is not None:
+            yield cached.answer
+            yield cached
+            return
         
         # Retrieve relevant context
-        context, sources, chunks = self._retrieve_context(question)
+        context, sources, chunks = await self._retrieve_context(question, query_embedding=query_embedding)
         
         if not context:
-            return FAQResponse(
-                answer="I don't have specific information about that in my knowledge base. Please call us at +91-731-555-0100 or email info@healthcareplus.com for assistance.",
-                sources=[],
-                confidence=0.3,
-                retrieved_chunks=[] if include_sources else None
-            )
+            answer = "I don't have specific information about that in my knowledge base. Please call us at +91-731-555-0100 or email info@healthcareplus.com for assistance."
+            yield answer
+            yield FAQResponse(answer=answer, sources=[], confidence=0.3, retrieved_chunks=[])
+            return
         
         # Create prompt
         user_prompt = f"""Context information from our clinic database:
@@ -101,38 +419,50 @@ Patient question: {question}
 
 Please provide a helpful, accurate answer based on the context above."""
         
-        # Get response from LLM
+        # Stream response from LLM
+        parts = []
         try:
-            response = self.client.chat.completions.create(
+            stream = stream_chat_completion(
+                self.client,
+                timeout=CHAT_TIMEOUT_SECONDS,
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": self._create_system_prompt()},
+                    self._system_message,
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.3,
                 max_tokens=500
             )
-            
-            answer = response.choices[0].message.content.strip()
-            confidence = self._calculate_confidence(answer, context)
-            
-            return FAQResponse(
-                answer=answer,
-                sources=sources,
-                confidence=confidence,
-                retrieved_chunks=chunks if include_sources else None
-            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
             
         except Exception as e:
             print(f"Error generating answer: {e}")
-            return FAQResponse(
-                answer="I apologize, but I'm having trouble accessing information right now. Please call us at +91-731-555-0100 for assistance.",
-                sources=[],
-                confidence=0.1,
-                retrieved_chunks=[] if include_sources else None
-            )
+            answer = "I apologize, but I'm having trouble accessing information right now. Please call us at +91-731-555-0100 for assistance."
+            if not parts:
+                yield answer
+            yield FAQResponse(answer=answer, sources=[], confidence=0.1, retrieved_chunks=[])
+            return
+        
+        answer = "".join(parts).strip()
+        confidence = self._calculate_confidence(answer, context)
+        
+        faq_response = FAQResponse(
+            answer=answer,
+            sources=sources,
+            confidence=confidence,
+            retrieved_chunks=chunks
+        )
+        if confidence >= ANSWER_CACHE_MIN_CONFIDENCE:
+            self.answer_cache.add(key, unit_embedding, faq_response)
+        yield faq_response
     
-    def handle_multi_turn_question(
+    async def handle_multi_turn_question(
         self, 
         question: str, 
         conversation_history: List[Dict[str, str]] = None
@@ -140,7 +470,7 @@ Please provide a helpful, accurate answer based on the context above."""
         """Handle questions with conversation context"""
         
         if not conversation_history:
-            return self.answer_question(question)
+            return await self.answer_question(question)
         
         # Enhance question with conversation context
         context_summary = "\n".join([
@@ -151,7 +481,7 @@ Please provide a helpful, accurate answer based on the context above."""
         enhanced_question = f"Previous conversation:\n{context_summary}\n\nCurrent question: {question}"
         
         # Retrieve context
-        context, sources, chunks = self._retrieve_context(enhanced_question)
+        context, sources, chunks = await self._retrieve_context(enhanced_question)
         
         if not context:
             return FAQResponse(
@@ -162,7 +492,7 @@ Please provide a helpful, accurate answer based on the context above."""
             )
         
         # Create messages with conversation history
-        messages = [{"role": "system", "content": self._create_system_prompt()}]
+        messages = [self._system_message]
         
         # Add conversation history
         for msg in conversation_history[-3:]:
@@ -175,7 +505,9 @@ Please provide a helpful, accurate answer based on the context above."""
         })
         
         try:
-            response = self.client.chat.completions.create(
+            response = await create_chat_completion(
+                self.client,
+                timeout=CHAT_TIMEOUT_SECONDS,
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
@@ -202,5 +534,24 @@ Please provide a helpful, accurate answer based on the context above."""
             )
 
 
-# Singleton instance
-faq_system = FAQSystem()
\ No newline at end of file
+# Shared instance, created on first use so importing this module doesn't
+# construct OpenAI clients (or fail on a missing API key)
+_faq_system: Optional[FAQSystem] = None
+_faq_system_lock = threading.Lock()
+
+
+def get_faq_system() -> FAQSystem:
+    """Get the shared FAQSystem"""
+    global _faq_system
+    if _faq_system is None:
+        with _faq_system_lock:
+            if _faq_system is None:
+                _faq_system = FAQSystem()
+    return _faq_system
+
+
+def __getattr__(name: str):
+    # Keeps `from backend.rag.faq_rag import faq_system` working
+    if name == "faq_system":
+        return get_faq_system()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
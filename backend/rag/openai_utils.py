@@ -0,0 +1,78 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Optional
+from openai import APITimeoutError, AsyncOpenAI, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+
+# Cap on OpenAI requests in flight across the whole process, so a burst of
+# chats queues here instead of fanning out into 429s
+LLM_INFLIGHT_LIMIT = int(os.getenv("LLM_INFLIGHT_LIMIT", "8"))
+llm_semaphore = asyncio.Semaphore(LLM_INFLIGHT_LIMIT)
+
+# Rate-limited and timed-out calls are retried with jittered exponential
+# backoff, three attempts in all; the semaphore is released while waiting.
+# This is the only retry layer: every client is created with the SDK's own
+# retries off (OPENAI_MAX_RETRIES).
+OPENAI_MAX_RETRIES = 0
+retry_on_transient_error = retry(
+    wait=wait_exponential_jitter(1, 30),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type((RateLimitError, APITimeoutError, asyncio.TimeoutError)),
+    reraise=True
+)
+
+# Per-attempt timeouts; a call that runs over is retried, since a fresh
+# attempt usually finishes well before a slow one would
+CHAT_TIMEOUT_SECONDS = 15
+EMBEDDING_TIMEOUT_SECONDS = 5
+
+
+@retry_on_transient_error
+async def create_chat_completion(client: AsyncOpenAI, timeout: Optional[float] = None, **kwargs):
+    """Create a chat completion within the in-flight limit"""
+    async with llm_semaphore:
+        return await asyncio.wait_for(client.chat.completions.create(**kwargs), timeout)
+
+
+@retry_on_transient_error
+async def create_embeddings(client: AsyncOpenAI, timeout: Optional[float] = None, **kwargs):
+    """Create embeddings within the in-flight limit"""
+    async with llm_semaphore:
+        return await asyncio.wait_for(client.embeddings.create(**kwargs), timeout)
+
+
+@retry_on_transient_error
+async def _open_chat_stream(client: AsyncOpenAI, timeout: Optional[float], **kwargs):
+    """Take an in-flight slot and open a streaming chat completion; the caller releases the slot"""
+    await llm_semaphore.acquire()
+    try:
+        return await asyncio.wait_for(client.chat.completions.create(stream=True, **kwargs), timeout)
+    except BaseException:
+        llm_semaphore.release()
+        raise
+
+
+async def stream_chat_completion(client: AsyncOpenAI, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[Any]:
+    """
+    Stream a chat completion's chunks within the in-flight limit
+    
+    The slot is held until the stream is finished, and once it has opened
+    the whole stream must finish within the timeout, since generating the
+    tokens takes far longer than the response headers.
+    """
+    stream = await _open_chat_stream(client, timeout, **kwargs)
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        chunks = stream.__aiter__()
+        while True:
+            remaining = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+            except StopAsyncIteration:
+                break
+            yield chunk
+    finally:
+        llm_semaphore.release()
+        await stream.response.aclose()
@@ -1,9 +1,267 @@
-import json
+import asyncio
+import hashlib
 import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
 import chromadb
+import orjson
+from cachetools import LRUCache
 from chromadb.config import Settings
+from backend.rag.embeddings import ChromaEmbeddingFunction, get_embedding_service
+
+# Chunks written per collection.add call; Chroma handles batches of 100-250
+# far better than one very large add
+ADD_BATCH_SIZE = 128
+
+# Embedding requests in flight during an ingest
+INGEST_CONCURRENCY = 4
+
+# Written next to the collection after each ingest; records which source JSON
+# and index settings the collection was built with, so an unchanged file is
+# not re-embedded
+INGEST_METADATA_FILE = "metadata.json"
+
+# HNSW index settings for new collections. OpenAI embeddings are unit length,
+# so cosine ranks exactly like L2; M and construction_ef are Chroma's
+# defaults, pinned so the index shape does not drift between releases.
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 100
+}
+
+# Search results kept per (normalized query, n_results, include_embeddings)
+SEARCH_CACHE_SIZE = 512
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Flattened chunks of the last ingested source, reused while its digest is unchanged
+CHUNKS_CACHE_FILE = "chunks.json"
+
+# SQLite pragmas used while bulk-loading the collection: no rollback journal
+# fsyncs and temp tables in memory. The store can be rebuilt from the JSON at
+# any time, so losing a partial ingest to a crash is acceptable.
+BULK_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY"
+}
+
+
+def _chunk(chunk_id: str, text: str, category: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """A searchable chunk"""
+    return {"id": chunk_id, "text": text, "category": category, "metadata": metadata}
+
+
+def _flatten_clinic_details(details: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Clinic, doctor and contact details"""
+    text = " ".join((
+        f"Clinic: {details['name']}. Doctor: {details['doctor']}, {details['specialization']}.",
+        f"Experience: {details['experience']}.",
+        f"Address: {details['address']}. Phone: {details['phone']}. Email: {details['email']}"
+    ))
+    return [_chunk("clinic_basic_info", text, "clinic_details", details)]
+
+
+def _flatten_location(loc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Location and directions"""
+    text = " ".join((
+        f"Clinic location: {loc['address']}. Landmark: {loc['landmark']}.",
+        f"Directions: {loc['directions']}",
+        f"Parking: {loc['parking']}",
+        f"Public transport: {loc['public_transport']}",
+        f"Accessibility: {loc['accessibility']}"
+    ))
+    return [_chunk("location_directions", text, "location", loc)]
+
+
+def _flatten_hours(hours: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Hours of operation"""
+    text = " ".join((
+        f"Clinic hours: Monday to Friday: {hours['monday_to_friday']}.",
+        f"Saturday: {hours['saturday']}. Sunday: {hours['sunday']}.",
+        f"Holidays: {hours['holidays']}. {hours['emergency_note']}"
+    ))
+    return [_chunk("hours_of_operation", text, "hours", hours)]
+
+
+def _flatten_insurance(ins: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Insurance and billing, plus consultation fees"""
+    text = " ".join((
+        f"Accepted insurance: {', '.join(ins['accepted_insurance'])}.",
+        f"Payment methods: {', '.join(ins['payment_methods'])}.",
+        f"Billing policy: {ins['billing_policy']}"
+    ))
+    
+    # Consultation fees
+    fees = ins['consultation_fees']
+    fee_text = "Consultation fees: " + ", ".join((
+        f"General consultation: {fees['general_consultation']}",
+        f"Follow-up visit: {fees['followup_visit']}",
+        f"Specialist consultation: {fees['specialist_consultation']}",
+        f"Physical exam: {fees['physical_exam']}"
+    ))
+    return [
+        _chunk("insurance_billing", text, "insurance", ins),
+        _chunk("consultation_fees", fee_text, "fees", fees)
+    ]
+
+
+def _flatten_visit_preparation(prep: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Visit preparation lists"""
+    return [
+        _chunk(key, f"{label}: " + ", ".join(prep[key]), "preparation", {"items": prep[key]})
+        for key, label in (
+            ("first_visit_requirements", "First visit requirements"),
+            ("what_to_bring", "What to bring"),
+            ("before_appointment", "Before appointment")
+        )
+    ]
+
+
+def _cancellation_text(cancel: Dict[str, Any]) -> str:
+    """Cancellation policy"""
+    return " ".join((
+        f"Cancellation policy: {cancel['notice_required']} notice required.",
+        f"Fee: {cancel['cancellation_fee']}",
+        f"How to cancel: {cancel['how_to_cancel']}",
+        f"Rescheduling: {cancel['rescheduling']}"
+    ))
+
+
+def _late_arrival_text(late: Dict[str, Any]) -> str:
+    """Late arrival policy"""
+    return " ".join((
+        f"Late arrival policy: {late['grace_period']} grace period.",
+        late['after_grace_period'],
+        f"Recommendation: {late['recommendation']}"
+    ))
+
+
+def _prescription_refill_text(rx: Dict[str, Any]) -> str:
+    """Prescription refill policy"""
+    return " ".join((
+        f"Prescription refill: {rx['process']}.",
+        f"Pickup: {rx['pickup']}.",
+        f"Controlled substances: {rx['controlled_substances']}"
+    ))
+
+
+def _medical_records_text(records: Dict[str, Any]) -> str:
+    """Medical records policy"""
+    return " ".join((
+        f"Medical records: {records['request_process']}.",
+        f"Processing time: {records['processing_time']}.",
+        f"Fees: {records['fees']}.",
+        f"Digital access: {records['digital_access']}"
+    ))
+
+
+# Each policy is optional; the key doubles as the chunk id
+POLICY_FORMATTERS: List[Tuple[str, Callable[[Dict[str, Any]], str]]] = [
+    ("cancellation_policy", _cancellation_text),
+    ("late_arrival_policy", _late_arrival_text),
+    ("prescription_refill", _prescription_refill_text),
+    ("medical_records", _medical_records_text)
+]
+
+
+def _flatten_policies(policies: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Clinic policies, one chunk each"""
+    return [
+        _chunk(key, formatter(policies[key]), "policy", policies[key])
+        for key, formatter in POLICY_FORMATTERS
+        if key in policies
+    ]
+
+
+def _flatten_covid(covid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """COVID-19 protocols"""
+    text = " ".join((
+        f"COVID-19 safety measures: {', '.join(covid['safety_measures'])}.",
+        f"Vaccination status: {covid['vaccination_status']}.",
+        f"Symptoms policy: {covid['symptoms_policy']}.",
+        f"Telemedicine: {covid['telemedicine']}"
+    ))
+    return [_chunk("covid19_protocols", text, "covid", covid)]
+
+
+def _flatten_services(services: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Services offered"""
+    return [
+        _chunk(key, f"{label}: " + ", ".join(services[key]), "services", {"services": services[key]})
+        for key, label in (
+            ("general_services", "General services"),
+            ("diagnostic_services", "Diagnostic services")
+        )
+    ]
+
+
+def _flatten_appointment_types(appointment_types: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One chunk per appointment type"""
+    return [
+        _chunk(
+            f"appointment_type_{appt_key}",
+            f"{appt_data['description']}. Duration: {appt_data['duration']}. Fee: {appt_data['fee']}",
+            "appointment_types",
+            appt_data
+        )
+        for appt_key, appt_data in appointment_types.items()
+    ]
+
+
+def _flatten_faqs(faqs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One chunk per FAQ"""
+    return [
+        _chunk(f"faq_{idx}", f"Question: {faq['question']} Answer: {faq['answer']}", "faq", faq)
+        for idx, faq in enumerate(faqs)
+    ]
+
+
+def _flatten_contact(contact: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Contact information"""
+    text = " ".join((
+        f"Contact: Appointments: {contact['appointments']}.",
+        f"General inquiries: {contact['general_inquiries']}.",
+        f"Emergency: {contact['emergency']}.",
+        f"WhatsApp: {contact['whatsapp']}"
+    ))
+    return [_chunk("contact_information", text, "contact", contact)]
+
+
+# Top-level clinic info sections, in chunk order; missing sections are skipped
+FLATTENERS: List[Tuple[str, Callable[[Any], List[Dict[str, Any]]]]] = [
+    ("clinic_details", _flatten_clinic_details),
+    ("location_and_directions", _flatten_location),
+    ("hours_of_operation", _flatten_hours),
+    ("insurance_and_billing", _flatten_insurance),
+    ("visit_preparation", _flatten_visit_preparation),
+    ("policies", _flatten_policies),
+    ("covid19_protocols", _flatten_covid),
+    ("services_offered", _flatten_services),
+    ("appointment_types", _flatten_appointment_types),
+    ("frequently_asked_questions", _flatten_faqs),
+    ("contact_information", _flatten_contact)
+]
+
+
+def flatten_clinic_info(clinic_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten nested clinic info into searchable chunks"""
+    chunks = []
+    for key, flatten in FLATTENERS:
+        if key in clinic_data:
+            chunks.extend(flatten(clinic_data[key]))
+    return chunks
+
+
+@lru_cache(maxsize=4)
+def _flatten_json_bytes(json_bytes: bytes) -> List[Dict[str, Any]]:
+    """Flatten clinic info JSON; an unchanged file is only parsed and flattened once"""
+    return flatten_clinic_info(orjson.loads(json_bytes))
 
 
 class VectorStore:
@@ -14,315 +272,325 @@ class VectorStore:
         Path(persist_directory).mkdir(parents=True, exist_ok=True)
         
         # Initialize ChromaDB client
-        self.client = chromadb.Client(Settings(
-            persist_directory=persist_directory,
-            anonymized_telemetry=False
-        ))
+        self.client = chromadb.PersistentClient(
+            path=persist_directory,
+            settings=Settings(anonymized_telemetry=False)
+        )
+        
+        # Bumped on every write so callers can invalidate cached search results
+        self.version = 0
+        
+        # search() runs on worker threads via asearch(), so the cache is locked
+        self._search_cache: LRUCache = LRUCache(maxsize=SEARCH_CACHE_SIZE)
+        self._search_cache_lock = threading.Lock()
+        
+        # Documents and queries are embedded with the same OpenAI model, so
+        # callers can pass a precomputed query embedding to search()
+        self.embedding_function = ChromaEmbeddingFunction()
         
         # Get or create collection
         self.collection_name = "clinic_faq"
         try:
-            self.collection = self.client.get_collection(name=self.collection_name)
-            print(f"✓ Loaded existing collection: {self.collection_name}")
-        except:
-            self.collection = self.client.create_collection(
+            self.collection = self.client.get_collection(
                 name=self.collection_name,
-                metadata={"description": "HealthCare Plus Clinic FAQ"}
+                embedding_function=self.embedding_function
             )
+            print(f"✓ Loaded existing collection: {self.collection_name}")
+        except ValueError:
+            # Chroma raises ValueError for a collection that does not exist
+            self.collection = self._create_collection()
             print(f"✓ Created new collection: {self.collection_name}")
     
-    def _flatten_clinic_info(self, clinic_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Flatten nested clinic info into searchable chunks"""
-        chunks = []
-        
-        # Clinic Details
-        if "clinic_details" in clinic_data:
-            details = clinic_data["clinic_details"]
-            text = f"Clinic: {details['name']}. Doctor: {details['doctor']}, {details['specialization']}. "
-            text += f"Experience: {details['experience']}. "
-            text += f"Address: {details['address']}. Phone: {details['phone']}. Email: {details['email']}"
-            chunks.append({
-                "id": "clinic_basic_info",
-                "text": text,
-                "category": "clinic_details",
-                "metadata": details
-            })
-        
-        # Location and Directions
-        if "location_and_directions" in clinic_data:
-            loc = clinic_data["location_and_directions"]
-            text = f"Clinic location: {loc['address']}. Landmark: {loc['landmark']}. "
-            text += f"Directions: {loc['directions']} "
-            text += f"Parking: {loc['parking']} "
-            text += f"Public transport: {loc['public_transport']} "
-            text += f"Accessibility: {loc['accessibility']}"
-            chunks.append({
-                "id": "location_directions",
-                "text": text,
-                "category": "location",
-                "metadata": loc
-            })
-        
-        # Hours of Operation
-        if "hours_of_operation" in clinic_data:
-            hours = clinic_data["hours_of_operation"]
-            text = f"Clinic hours: Monday to Friday: {hours['monday_to_friday']}. "
-            text += f"Saturday: {hours['saturday']}. Sunday: {hours['sunday']}. "
-            text += f"Holidays: {hours['holidays']}. {hours['emergency_note']}"
-            chunks.append({
-                "id": "hours_of_operation",
-                "text": text,
-                "category": "hours",
-                "metadata": hours
-            })
-        
-        # Insurance and Billing
-        if "insurance_and_billing" in clinic_data:
-            ins = clinic_data["insurance_and_billing"]
-            text = "Accepted insurance: " + ", ".join(ins['accepted_insurance']) + ". "
-            text += "Payment methods: " + ", ".join(ins['payment_methods']) + ". "
-            text += f"Billing policy: {ins['billing_policy']}"
-            chunks.append({
-                "id": "insurance_billing",
-                "text": text,
-                "category": "insurance",
-                "metadata": ins
-            })
-            
-            # Consultation fees
-            fees = ins['consultation_fees']
-            fee_text = "Consultation fees: "
-            fee_text += f"General consultation: {fees['general_consultation']}, "
-            fee_text += f"Follow-up visit: {fees['followup_visit']}, "
-            fee_text += f"Specialist consultation: {fees['specialist_consultation']}, "
-            fee_text += f"Physical exam: {fees['physical_exam']}"
-            chunks.append({
-                "id": "consultation_fees",
-                "text": fee_text,
-                "category": "fees",
-                "metadata": fees
-            })
-        
-        # Visit Preparation
-        if "visit_preparation" in clinic_data:
-            prep = clinic_data["visit_preparation"]
-            
-            text = "First visit requirements: " + ", ".join(prep['first_visit_requirements'])
-            chunks.append({
-                "id": "first_visit_requirements",
-                "text": text,
-                "category": "preparation",
-                "metadata": {"items": prep['first_visit_requirements']}
-            })
-            
-            text = "What to bring: " + ", ".join(prep['what_to_bring'])
-            chunks.append({
-                "id": "what_to_bring",
-                "text": text,
-                "category": "preparation",
-                "metadata": {"items": prep['what_to_bring']}
-            })
-            
-            text = "Before appointment: " + ", ".join(prep['before_appointment'])
-            chunks.append({
-                "id": "before_appointment",
-                "text": text,
-                "category": "preparation",
-                "metadata": {"items": prep['before_appointment']}
-            })
-        
-        # Policies
-        if "policies" in clinic_data:
-            policies = clinic_data["policies"]
-            
-            # Cancellation
-            if "cancellation_policy" in policies:
-                cancel = policies["cancellation_policy"]
-                text = f"Cancellation policy: {cancel['notice_required']} notice required. "
-                text += f"Fee: {cancel['cancellation_fee']} "
-                text += f"How to cancel: {cancel['how_to_cancel']} "
-                text += f"Rescheduling: {cancel['rescheduling']}"
-                chunks.append({
-                    "id": "cancellation_policy",
-                    "text": text,
-                    "category": "policy",
-                    "metadata": cancel
-                })
-            
-            # Late arrival
-            if "late_arrival_policy" in policies:
-                late = policies["late_arrival_policy"]
-                text = f"Late arrival policy: {late['grace_period']} grace period. "
-                text += f"{late['after_grace_period']} "
-                text += f"Recommendation: {late['recommendation']}"
-                chunks.append({
-                    "id": "late_arrival_policy",
-                    "text": text,
-                    "category": "policy",
-                    "metadata": late
-                })
-            
-            # Prescription refill
-            if "prescription_refill" in policies:
-                rx = policies["prescription_refill"]
-                text = f"Prescription refill: {rx['process']}. "
-                text += f"Pickup: {rx['pickup']}. "
-                text += f"Controlled substances: {rx['controlled_substances']}"
-                chunks.append({
-                    "id": "prescription_refill",
-                    "text": text,
-                    "category": "policy",
-                    "metadata": rx
-                })
-            
-            # Medical records
-            if "medical_records" in policies:
-                records = policies["medical_records"]
-                text = f"Medical records: {records['request_process']}. "
-                text += f"Processing time: {records['processing_time']}. "
-                text += f"Fees: {records['fees']}. "
-                text += f"Digital access: {records['digital_access']}"
-                chunks.append({
-                    "id": "medical_records",
-                    "text": text,
-                    "category": "policy",
-                    "metadata": records
-                })
-        
-        # COVID-19 Protocols
-        if "covid19_protocols" in clinic_data:
-            covid = clinic_data["covid19_protocols"]
-            text = "COVID-19 safety measures: " + ", ".join(covid['safety_measures']) + ". "
-            text += f"Vaccination status: {covid['vaccination_status']}. "
-            text += f"Symptoms policy: {covid['symptoms_policy']}. "
-            text += f"Telemedicine: {covid['telemedicine']}"
-            chunks.append({
-                "id": "covid19_protocols",
-                "text": text,
-                "category": "covid",
-                "metadata": covid
-            })
-        
-        # Services Offered
-        if "services_offered" in clinic_data:
-            services = clinic_data["services_offered"]
-            
-            text = "General services: " + ", ".join(services['general_services'])
-            chunks.append({
-                "id": "general_services",
-                "text": text,
-                "category": "services",
-                "metadata": {"services": services['general_services']}
-            })
-            
-            text = "Diagnostic services: " + ", ".join(services['diagnostic_services'])
-            chunks.append({
-                "id": "diagnostic_services",
-                "text": text,
-                "category": "services",
-                "metadata": {"services": services['diagnostic_services']}
-            })
-        
-        # Appointment Types
-        if "appointment_types" in clinic_data:
-            for appt_key, appt_data in clinic_data["appointment_types"].items():
-                text = f"{appt_data['description']}. Duration: {appt_data['duration']}. Fee: {appt_data['fee']}"
-                chunks.append({
-                    "id": f"appointment_type_{appt_key}",
-                    "text": text,
-                    "category": "appointment_types",
-                    "metadata": appt_data
-                })
+    def _create_collection(self):
+        """Create the FAQ collection"""
+        return self.client.create_collection(
+            name=self.collection_name,
+            metadata={"description": "HealthCare Plus Clinic FAQ", **HNSW_METADATA},
+            embedding_function=self.embedding_function
+        )
+    
+    @contextmanager
+    def _bulk_mode(self) -> Iterator[None]:
+        """Relax SQLite durability for the duration of a bulk ingest"""
+        try:
+            conn = self.client._server._sysdb._conn_pool.connect()
+        except AttributeError:
+            # Chroma internals moved; ingest with the default pragmas
+            yield
+            return
         
-        # FAQs
-        if "frequently_asked_questions" in clinic_data:
-            for idx, faq in enumerate(clinic_data["frequently_asked_questions"]):
-                text = f"Question: {faq['question']} Answer: {faq['answer']}"
-                chunks.append({
-                    "id": f"faq_{idx}",
-                    "text": text,
-                    "category": "faq",
-                    "metadata": faq
-                })
+        previous = {
+            name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in BULK_PRAGMAS
+        }
+        for name, value in BULK_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+    
+    def _source_digest(self, json_file_path: str) -> str:
+        """SHA-256 of the source JSON file"""
+        return hashlib.sha256(Path(json_file_path).read_bytes()).hexdigest()
+    
+    def _ingest_is_current(self, digest: str) -> bool:
+        """Whether the collection already holds a complete ingest of this source"""
+        try:
+            metadata = orjson.loads((Path(self.persist_directory) / INGEST_METADATA_FILE).read_bytes())
+        except (OSError, ValueError):
+            return False
         
-        # Contact Information
-        if "contact_information" in clinic_data:
-            contact = clinic_data["contact_information"]
-            text = f"Contact: Appointments: {contact['appointments']}. "
-            text += f"General inquiries: {contact['general_inquiries']}. "
-            text += f"Emergency: {contact['emergency']}. "
-            text += f"WhatsApp: {contact['whatsapp']}"
-            chunks.append({
-                "id": "contact_information",
-                "text": text,
-                "category": "contact",
-                "metadata": contact
-            })
+        # The count guards against an ingest that was interrupted part-way,
+        # and the index settings against a collection built before they
+        # changed (Chroma fixes them when the collection is created)
+        return (
+            metadata.get("source_sha256") == digest
+            and metadata.get("hnsw") == HNSW_METADATA
+            and metadata.get("count") == self.collection.count()
+        )
+    
+    def _record_ingest(self, digest: str, count: int):
+        """Remember which source the collection was built from"""
+        (Path(self.persist_directory) / INGEST_METADATA_FILE).write_bytes(
+            orjson.dumps({"source_sha256": digest, "hnsw": HNSW_METADATA, "count": count})
+        )
+    
+    def _load_chunks(self, json_file_path: str, digest: str) -> List[Dict[str, Any]]:
+        """Flattened chunks for the source JSON, from the on-disk cache if its digest matches"""
+        cache_path = Path(self.persist_directory) / CHUNKS_CACHE_FILE
+        try:
+            cached = orjson.loads(cache_path.read_bytes())
+            if cached["source_sha256"] == digest:
+                return cached["chunks"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
         
+        chunks = _flatten_json_bytes(Path(json_file_path).read_bytes())
+        cache_path.write_bytes(orjson.dumps({"source_sha256": digest, "chunks": chunks}))
         return chunks
     
-    def initialize_from_json(self, json_file_path: str):
-        """Load clinic info from JSON and store in vector DB"""
-        
-        # Load JSON data
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            clinic_data = json.load(f)
+    def _prepare_ingest(self, json_file_path: str, digest: str) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """Load and flatten the clinic JSON into ids, documents and metadatas"""
         
-        # Flatten into chunks
-        chunks = self._flatten_clinic_info(clinic_data)
+        # Load JSON data and flatten into chunks
+        chunks = self._load_chunks(json_file_path, digest)
         
-        # Clear existing data
+        ids = [chunk["id"] for chunk in chunks]
+        documents = [chunk["text"] for chunk in chunks]
+        # A handful of categories cover every chunk, so chunks share one
+        # metadata dict per category (Chroma only reads them)
+        category_metadata: Dict[str, Dict[str, Any]] = {}
+        metadatas = [
+            category_metadata.setdefault(chunk["category"], {"category": chunk["category"]})
+            for chunk in chunks
+        ]
+        return ids, documents, metadatas
+    
+    def _add_batches(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        batch_size: int,
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """Replace the collection's contents with these chunks, added in batches
+        (embedded by Chroma unless embeddings are given)"""
+        # Clear existing data only now, so a failure while loading or embedding
+        # leaves the stored collection intact. Dropping the collection gives a
+        # fresh index without deleting every record through SQLite.
         try:
-            self.collection.delete(where={})
-        except:
+            self.client.delete_collection(self.collection_name)
+        except ValueError:
             pass
+        self.collection = self._create_collection()
         
-        # Add to collection
-        ids = [chunk["id"] for chunk in chunks]
-        documents = [chunk["text"] for chunk in chunks]
-        metadatas = [{"category": chunk["category"]} for chunk in chunks]
+        with self._bulk_mode():
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                self.collection.add(
+                    ids=ids[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    embeddings=embeddings[start:end] if embeddings is not None else None
+                )
+        self.version += 1
+        with self._search_cache_lock:
+            self._search_cache.clear()
         
-        self.collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
+        print(f"✓ Initialized vector store with {len(ids)} chunks")
+    
+    def _skip_ingest(self) -> int:
+        """Keep the stored collection as it is and report its size"""
+        count = self.collection.count()
+        print(f"✓ Vector store is up to date with {count} chunks")
+        return count
+    
+    def initialize_from_json(
+        self,
+        json_file_path: str,
+        batch_size: int = ADD_BATCH_SIZE,
+        concurrency: int = INGEST_CONCURRENCY
+    ):
+        """Load clinic info from JSON and store in vector DB (skipped if the file is unchanged)
+        
+        Blocking entry point for scripts such as the CLI below; runs
+        initialize_from_json_async on an event loop of its own. Async code
+        (e.g. the app's startup) awaits initialize_from_json_async instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.initialize_from_json_async(json_file_path, batch_size, concurrency))
+        raise RuntimeError(
+            "initialize_from_json() can't run inside an event loop; await initialize_from_json_async() instead"
         )
+    
+    async def initialize_from_json_async(
+        self,
+        json_file_path: str,
+        batch_size: int = ADD_BATCH_SIZE,
+        concurrency: int = INGEST_CONCURRENCY
+    ):
+        """Load clinic info from JSON, embedding batches concurrently (skipped if the file is unchanged)"""
+        digest = await asyncio.to_thread(self._source_digest, json_file_path)
+        if await asyncio.to_thread(self._ingest_is_current, digest):
+            return self._skip_ingest()
+        
+        ids, documents, metadatas = await asyncio.to_thread(self._prepare_ingest, json_file_path, digest)
+        
+        # The semaphore and client are created on this call's loop, since
+        # both stay bound to a loop once used. The service's shared client
+        # may belong to another (or an already closed) loop.
+        service = get_embedding_service()
+        semaphore = asyncio.Semaphore(concurrency)
+        async with service.create_async_client() as client:
+            async def embed(batch: List[str]) -> List[List[float]]:
+                async with semaphore:
+                    return await service.aget_embeddings(batch, client=client)
+            
+            batches = await asyncio.gather(*(
+                embed(documents[start:start + batch_size])
+                for start in range(0, len(documents), batch_size)
+            ))
+        embeddings = [embedding for batch in batches for embedding in batch]
         
-        print(f"✓ Initialized vector store with {len(chunks)} chunks")
-        return len(chunks)
+        # Writes stay on one thread: SQLite serialises them anyway, and the
+        # bulk pragmas are set on that thread's connection
+        await asyncio.to_thread(self._add_batches, ids, documents, metadatas, batch_size, embeddings)
+        await asyncio.to_thread(self._record_ingest, digest, len(ids))
+        return len(ids)
     
-    def search(self, query: str, n_results: int = 3) -> List[Dict[str, Any]]:
-        """Search for relevant information"""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
+    def _search_key(self, query: str, n_results: int, include_embeddings: bool) -> Tuple[str, int, bool]:
+        """Cache key for a search (case and whitespace insensitive)"""
+        return _WHITESPACE_RE.sub(" ", query.strip().lower()), n_results, include_embeddings
+    
+    def _cached_search(self, key: Tuple[str, int, bool]) -> Optional[List[Dict[str, Any]]]:
+        """Cached results for a search key, if any"""
+        with self._search_cache_lock:
+            return self._search_cache.get(key)
+    
+    def search(
+        self,
+        query: str,
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Search for relevant information (query_embedding skips embedding the query again)"""
+        key = self._search_key(query, n_results, include_embeddings)
+        cached = self._cached_search(key)
+        if cached is not None:
+            return cached
+        
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        
+        if query_embedding is not None:
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=include
+            )
+        else:
+            results = self.collection.query(
+                query_texts=[query],
+                n_results=n_results,
+                include=include
+            )
         
-        # Format results
+        # Format results (one query, so each field holds a single row)
         formatted_results = []
         if results['ids'] and results['ids'][0]:
-            for i in range(len(results['ids'][0])):
-                formatted_results.append({
-                    "id": results['ids'][0][i],
-                    "text": results['documents'][0][i],
-                    "category": results['metadatas'][0][i]['category'],
-                    "distance": results['distances'][0][i] if 'distances' in results else None
-                })
+            ids = results['ids'][0]
+            distances = (results.get('distances') or [[None] * len(ids)])[0]
+            formatted_results = [
+                {"id": id_, "text": text, "category": metadata['category'], "distance": distance}
+                for id_, text, metadata, distance in zip(
+                    ids, results['documents'][0], results['metadatas'][0], distances
+                )
+            ]
+            if include_embeddings:
+                for result, embedding in zip(formatted_results, results['embeddings'][0]):
+                    result["embedding"] = embedding
         
+        with self._search_cache_lock:
+            self._search_cache[key] = formatted_results
         return formatted_results
     
+    async def asearch(
+        self,
+        query: str,
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Async search; the query is embedded through the batching embedding service"""
+        cached = self._cached_search(self._search_key(query, n_results, include_embeddings))
+        if cached is not None:
+            return cached
+        
+        if query_embedding is None:
+            query_embedding = await get_embedding_service().aget_embedding(query)
+        return await asyncio.to_thread(self.search, query, n_results, query_embedding, include_embeddings)
+    
     def get_collection_count(self) -> int:
         """Get number of documents in collection"""
         return self.collection.count()
 
 
-# Initialize on import (singleton pattern)
-vector_store = VectorStore()
+# Created on first use rather than on import (singleton pattern)
+_vector_store: Optional[VectorStore] = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """Get the shared VectorStore"""
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = VectorStore()
+    return _vector_store
 
 
-# CLI tool to initialize the database
+def __getattr__(name: str):
+    # Keeps `from backend.rag.vector_store import vector_store` working
+    if name == "vector_store":
+        return get_vector_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# CLI tool to initialize the database (run as `python -m backend.rag.vector_store`)
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    
     print("Initializing vector store...")
+    vector_store = get_vector_store()
     clinic_info_path = "data/clinic_info.json"
     
     if not os.path.exists(clinic_info_path):
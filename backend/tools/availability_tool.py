@@ -1,7 +1,26 @@
+import threading
 from datetime import datetime
+from operator import attrgetter
 from typing import Dict, Any
+from cachetools import TTLCache, cached
 from backend.api.calendly_integration import calendly_api
 
+# 12-hour display strings for every HH:MM of the day, built once
+_TIME_12HR: Dict[str, str] = {
+    f"{hour:02d}:{minute:02d}": datetime(2000, 1, 1, hour, minute).strftime("%I:%M %p").lstrip('0')
+    for hour in range(24)
+    for minute in range(60)
+}
+
+_SLOT_FIELDS = attrgetter("start_time", "end_time", "available")
+
+# Formatted availability shared across sessions. Bookings never go stale (the
+# revision is in the key), so the TTL only bounds memory and how long a date
+# keeps its cached slots after midnight moves it into the past.
+AVAILABILITY_CACHE_TTL_SECONDS = 30
+_availability_cache: TTLCache = TTLCache(maxsize=256, ttl=AVAILABILITY_CACHE_TTL_SECONDS)
+_availability_cache_lock = threading.Lock()
+
 
 def check_availability(date: str, appointment_type: str) -> Dict[str, Any]:
     """
@@ -15,38 +34,7 @@ def check_availability(date: str, appointment_type: str) -> Dict[str, Any]:
         Dictionary with available slots and metadata
     """
     try:
-        # Get availability from Calendly API
-        availability = calendly_api.get_availability(date, appointment_type)
-        
-        # Filter only available slots
-        available_slots = [
-            slot for slot in availability.available_slots 
-            if slot.available
-        ]
-        
-        # Format for agent consumption
-        result = {
-            "date": availability.date,
-            "day_of_week": availability.day_of_week,
-            "total_slots": availability.total_slots,
-            "available_count": len(available_slots),
-            "available_slots": [
-                {
-                    "start_time": slot.start_time,
-                    "end_time": slot.end_time,
-                    "display_time": _format_time_12hr(slot.start_time)
-                }
-                for slot in available_slots
-            ]
-        }
-        
-        # Add helpful message
-        if len(available_slots) == 0:
-            result["message"] = f"No available slots on {availability.day_of_week}, {date}"
-        else:
-            result["message"] = f"Found {len(available_slots)} available slots on {availability.day_of_week}, {date}"
-        
-        return result
+        return _copy_availability(_cached_availability(date, appointment_type))
         
     except ValueError as e:
         return {
@@ -64,10 +52,60 @@ def check_availability(date: str, appointment_type: str) -> Dict[str, Any]:
         }
 
 
+# The booking revision is part of the key, so a booking or cancellation on a
+# date takes effect immediately instead of after the TTL
+@cached(
+    _availability_cache,
+    key=lambda date, appointment_type: (date, appointment_type, calendly_api.availability_revision(date)),
+    lock=_availability_cache_lock
+)
+def _cached_availability(date: str, appointment_type: str) -> Dict[str, Any]:
+    """Availability for agent consumption; errors propagate and are not cached"""
+    # Get availability from Calendly API
+    availability = calendly_api.get_availability(date, appointment_type)
+    
+    # Filter only available slots and format them for agent consumption in one pass
+    available_slots = [
+        {
+            "start_time": start_time,
+            "end_time": end_time,
+            "display_time": _format_time_12hr(start_time)
+        }
+        for start_time, end_time, available in map(_SLOT_FIELDS, availability.available_slots)
+        if available
+    ]
+    
+    result = {
+        "date": availability.date,
+        "day_of_week": availability.day_of_week,
+        "total_slots": availability.total_slots,
+        "available_count": len(available_slots),
+        "available_slots": available_slots
+    }
+    
+    # Add helpful message
+    if len(available_slots) == 0:
+        result["message"] = f"No available slots on {availability.day_of_week}, {date}"
+    else:
+        result["message"] = f"Found {len(available_slots)} available slots on {availability.day_of_week}, {date}"
+    
+    return result
+
+
+def _copy_availability(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a cached result, down to the slot dicts, that callers are free to modify"""
+    return {**result, "available_slots": [dict(slot) for slot in result["available_slots"]]}
+
+
 def _format_time_12hr(time_24hr: str) -> str:
     """Convert 24-hour time to 12-hour format with AM/PM"""
+    formatted = _TIME_12HR.get(time_24hr)
+    if formatted is not None:
+        return formatted
+    
+    # Non-canonical input such as "9:30"
     try:
         time_obj = datetime.strptime(time_24hr, "%H:%M")
         return time_obj.strftime("%I:%M %p").lstrip('0')
-    except:
+    except (TypeError, ValueError):
         return time_24hr
\ No newline at end of file
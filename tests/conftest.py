@@ -0,0 +1,37 @@
+import os
+import tempfile
+import pytest
+from pytest_asyncio import is_async_test
+
+# Bookings made by the tests go to a throwaway database, never data/bookings.db.
+# Assigned rather than defaulted: xdist workers inherit the controller's
+# environment, and each worker needs a database of its own.
+_worker = os.getenv("PYTEST_XDIST_WORKER", "main")
+os.environ["BOOKINGS_DB"] = os.path.join(tempfile.mkdtemp(prefix=f"bookings-{_worker}-"), "bookings.db")
+
+
+
+def pytest_collection_modifyitems(items):
+    """Run every async test on one session-wide event loop: the agent and FAQ
+    system are module singletons whose AsyncOpenAI clients keep connections
+    bound to the loop they were first used on"""
+    session_loop = pytest.mark.asyncio(scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
+
+@pytest.fixture(scope="session")
+def calendly():
+    """Calendly mock with no bookings, shared by the whole test session"""
+    from backend.api.calendly_integration import calendly_api
+    calendly_api.reset()
+    yield calendly_api
+
+
+@pytest.fixture(scope="session", autouse=True)
+def warm_agent():
+    """Load the agent's tokenizer and FAQ index once, before any test runs"""
+    from backend.agent.scheduling_agent import agent
+    agent.warm_up()
+    yield agent